@@ -0,0 +1,188 @@
+import hashlib
+import logging
+import numpy as np
+import numpy.typing as npt
+import os
+import tempfile
+import typing
+from pathlib import Path
+
+__all__ = ("DistanceField",)
+
+logger = logging.getLogger(__name__)
+
+# moves of a player, the order decides which step next_step prefers when several are equally short
+DIRECTIONS = tuple((dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy)
+UNREACHABLE = np.iinfo(np.uint16).max
+NO_STEP = -1
+# the tables take 3 * cells ** 2 bytes, maps with more open cells are not precomputed
+MAX_CELLS = 2500
+# keys of the layouts over MAX_CELLS, the warning about each of them is logged once
+_too_large: set[str] = set()
+FORMAT_VERSION = 1
+
+
+def wall_mask_key(wall_mask: npt.NDArray[np.bool_]) -> str:
+    """Content hash of a wall layout, the name of its tables in the cache"""
+    digest = hashlib.sha256(f"{FORMAT_VERSION}:{wall_mask.shape}".encode())
+    digest.update(np.packbits(wall_mask).tobytes())
+    return digest.hexdigest()[:32]
+
+
+def _neighbours(wall_mask: npt.NDArray[np.bool_], cell_ids: npt.NDArray[np.int32]) -> npt.NDArray[np.int32]:
+    """(len(DIRECTIONS), cells) index of the neighbour of every open cell in every direction, -1 for walls"""
+    padded = np.full((cell_ids.shape[0] + 2, cell_ids.shape[1] + 2), -1, dtype=np.int32)
+    padded[1:-1, 1:-1] = cell_ids
+    ys, xs = np.nonzero(~wall_mask)
+    return np.stack([padded[ys + 1 + dy, xs + 1 + dx] for dx, dy in DIRECTIONS])
+
+
+def _all_pairs(neighbours: npt.NDArray[np.int32]) -> tuple[npt.NDArray[np.uint16], npt.NDArray[np.int8]]:
+    """Distances between all open cells and the index in DIRECTIONS of the first step of a shortest path.
+
+    BFS from every cell at once: row s of the frontier holds the cells at the current distance from s.
+    """
+    num_of_cells = neighbours.shape[1]
+    dist = np.full((num_of_cells, num_of_cells), UNREACHABLE, dtype=np.uint16)
+    np.fill_diagonal(dist, 0)
+    reached = np.eye(num_of_cells, dtype=np.bool_)
+    frontier = reached.copy()
+    level = 0
+    while frontier.any():
+        level += 1
+        following = np.zeros_like(frontier)
+        for neighbour in neighbours:
+            has = neighbour >= 0
+            following[:, has] |= frontier[:, neighbour[has]]
+        following &= ~reached
+        dist[following] = level
+        reached |= following
+        frontier = following
+
+    next_step = np.full((num_of_cells, num_of_cells), NO_STEP, dtype=np.int8)
+    for direction, neighbour in enumerate(neighbours):
+        has = np.flatnonzero(neighbour >= 0)
+        closer = (dist[neighbour[has]].astype(np.int32) + 1 == dist[has]) & (next_step[has] == NO_STEP)
+        next_step[has] = np.where(closer, direction, next_step[has])
+
+    return dist, next_step
+
+
+class DistanceField:
+    """Wall-aware distances and next steps between all open cells of a wall layout.
+
+    Walls don't change during a game, so the tables are computed once per layout, saved to cache_dir
+    under the content hash of the layout and memory-mapped by every board with the same walls.
+    Other players are not taken into account, step_around corrects a step they block.
+    Coordinates outside the layout or on walls are unreachable.
+    """
+
+    # open tables of this process by (cache_dir, key), boards of the same map share them
+    _loaded: dict[tuple[str, str], "DistanceField"] = {}
+
+    def __init__(self, cache_dir: str | Path, wall_mask: npt.NDArray[np.bool_]):
+        self.cache_dir = str(cache_dir)
+        self.wall_mask = wall_mask
+        self.key = wall_mask_key(wall_mask)
+        self.cell_ids = np.full(wall_mask.shape, -1, dtype=np.int32)
+        self.cell_ids[~wall_mask] = np.arange(np.count_nonzero(~wall_mask), dtype=np.int32)
+        self._neighbours = _neighbours(wall_mask, self.cell_ids)
+        self.dist, self.next_step = self._load_or_build()
+
+    @classmethod
+    def get(cls, cache_dir: str | Path, wall_mask: npt.NDArray[np.bool_]) -> typing.Optional["DistanceField"]:
+        """Field of the layout, None for layouts with more than MAX_CELLS open cells"""
+        key = wall_mask_key(wall_mask)
+        if key in _too_large:
+            return None
+        if np.count_nonzero(~wall_mask) > MAX_CELLS:
+            logger.warning("Distance field of layout %s isn't built: more than %s open cells", key, MAX_CELLS)
+            _too_large.add(key)
+            return None
+
+        cache_key = str(cache_dir), key
+        if cache_key not in cls._loaded:
+            cls._loaded[cache_key] = cls(cache_dir, wall_mask)
+        return cls._loaded[cache_key]
+
+    def _paths(self) -> tuple[Path, Path]:
+        return Path(self.cache_dir) / f"{self.key}.dist.npy", Path(self.cache_dir) / f"{self.key}.next.npy"
+
+    def _load_or_build(self) -> tuple[npt.NDArray[np.uint16], npt.NDArray[np.int8]]:
+        dist_path, next_path = self._paths()
+        if not (dist_path.exists() and next_path.exists()):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for path, table in zip((dist_path, next_path), _all_pairs(self._neighbours)):
+                # written under a temporary name, so a concurrent reader never sees half a table
+                with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as fout:
+                    np.save(fout, table)
+                os.replace(fout.name, path)
+
+        return np.load(dist_path, mmap_mode="r"), np.load(next_path, mmap_mode="r")
+
+    def __getstate__(self):
+        return {"cache_dir": self.cache_dir, "wall_mask": np.packbits(self.wall_mask), "shape": self.wall_mask.shape}
+
+    def __setstate__(self, state):
+        # unpickled fields map the same files again instead of carrying the tables
+        size = state["shape"][0] * state["shape"][1]
+        wall_mask = np.unpackbits(state["wall_mask"], count=size).astype(np.bool_).reshape(state["shape"])
+        self.__dict__.update(self.get(state["cache_dir"], wall_mask).__dict__)
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _cell_id(self, x: int, y: int) -> int:
+        size_y, size_x = self.cell_ids.shape
+        return int(self.cell_ids[y, x]) if 0 <= x < size_x and 0 <= y < size_y else -1
+
+    def get_dist(self, x: int, y: int, target_x: int, target_y: int) -> int:
+        """Number of moves from (x, y) to the target, -1 if it can't be reached"""
+        source, target = self._cell_id(x, y), self._cell_id(target_x, target_y)
+        if source < 0 or target < 0 or self.dist[source, target] == UNREACHABLE:
+            return -1
+        return int(self.dist[source, target])
+
+    def get_dists(self, x: int, y: int, coords: npt.NDArray[np.intp]) -> npt.NDArray[np.int32]:
+        """Distances from (x, y) to every (x, y) row of coords, -1 for unreachable ones"""
+        source = self._cell_id(x, y)
+        if source < 0 or not len(coords):
+            return np.full(len(coords), -1, dtype=np.int32)
+
+        size_y, size_x = self.cell_ids.shape
+        inside = (coords[:, 0] >= 0) & (coords[:, 0] < size_x) & (coords[:, 1] >= 0) & (coords[:, 1] < size_y)
+        targets = np.full(len(coords), -1, dtype=np.int32)
+        targets[inside] = self.cell_ids[coords[inside, 1], coords[inside, 0]]
+        dists = self.dist[source, np.maximum(targets, 0)].astype(np.int32)
+        return np.where((targets >= 0) & (dists != UNREACHABLE), dists, -1)
+
+    def get_step(self, x: int, y: int, target_x: int, target_y: int) -> typing.Optional[tuple[int, int]]:
+        """(dx, dy) of the first move of a shortest path, None if the target is unreachable or reached"""
+        source, target = self._cell_id(x, y), self._cell_id(target_x, target_y)
+        if source < 0 or target < 0 or self.next_step[source, target] == NO_STEP:
+            return None
+        return DIRECTIONS[self.next_step[source, target]]
+
+    def step_around(
+        self, x: int, y: int, target_x: int, target_y: int, is_free: typing.Callable[[int, int], bool]
+    ) -> typing.Optional[tuple[int, int]]:
+        """get_step corrected for obstacles the field doesn't know about, e.g. players.
+
+        Takes the first free step which keeps the path shortest, otherwise the first free step which keeps
+        the distance (a sidestep), otherwise None.
+        """
+        source, target = self._cell_id(x, y), self._cell_id(target_x, target_y)
+        if source < 0 or target < 0 or self.dist[source, target] in (0, UNREACHABLE):
+            return None
+
+        step = self.get_step(x, y, target_x, target_y)
+        if is_free(x + step[0], y + step[1]):
+            return step
+
+        dist = int(self.dist[source, target])
+        for wanted in (dist - 1, dist):
+            for direction, (dx, dy) in enumerate(DIRECTIONS):
+                neighbour = self._neighbours[direction, source]
+                if neighbour >= 0 and self.dist[neighbour, target] == wanted and is_free(x + dx, y + dy):
+                    return dx, dy
+        return None
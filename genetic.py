@@ -1,5 +1,8 @@
 import attr
+import numpy as np
+import numpy.typing as npt
 import random
+import typing
 from tqdm.auto import tqdm
 
 import util as lib_util
@@ -13,9 +16,37 @@ class Individual:
         raise NotImplementedError()
 
 
+class Population:
+    """Whole population at once, so that genetic operators run in a few vectorized calls instead of per individual"""
+
+    def __len__(self) -> int:
+        raise NotImplementedError()
+
+    def individuals(self) -> list[Individual]:
+        """Lightweight views of the individuals, in row order"""
+        raise NotImplementedError()
+
+    def take(self, indexes: npt.ArrayLike) -> "Population":
+        """New population of copies of the given rows, repeats are independent copies"""
+        raise NotImplementedError()
+
+    def crossover(self, first: npt.ArrayLike, second: npt.ArrayLike) -> "Population":
+        """Children of pairs of rows first[i], second[i]"""
+        raise NotImplementedError()
+
+    def mutate(self, indexes: npt.ArrayLike):
+        """Mutate the given rows in place"""
+        raise NotImplementedError()
+
+    def concat(self, other: "Population") -> "Population":
+        raise NotImplementedError()
+
+
 @attr.s(slots=True, kw_only=True)
 class GeneticAlgorithm:
     individual_factory = attr.ib(default=Individual)
+    # if set, `population_factory(size)` gives a Population and the run uses its vectorized operators
+    population_factory: typing.Optional[typing.Callable[[int], Population]] = attr.ib(default=None)
 
     max_generations: int = attr.ib()
     population_size: int = attr.ib()
@@ -37,6 +68,9 @@ class GeneticAlgorithm:
         return [self.individual_factory() for _ in range(self.population_size)]
 
     def run(self) -> Individual:
+        if self.population_factory is not None:
+            return self.run_population()
+
         population = self.init_population()
         ranked_population = self.ranking_phase(population)
 
@@ -48,6 +82,28 @@ class GeneticAlgorithm:
 
         return ranked_population[0]
 
+    def run_population(self) -> Individual:
+        ranked_population = self.rank_population(self.population_factory(self.population_size))
+        crossover_probs = np.array(self.crossover_weights) / sum(self.crossover_weights)
+        selection_probs = np.array(self.selection_weights) / sum(self.selection_weights)
+
+        for epoch in tqdm(range(self.max_generations)):
+            parents = np.random.choice(len(ranked_population), size=self.num_of_children * 2, p=crossover_probs)
+            children = ranked_population.crossover(parents[: self.num_of_children], parents[self.num_of_children :])
+            count = self.population_size - len(children)
+            survivors = ranked_population.take(np.random.choice(len(ranked_population), size=count, p=selection_probs))
+            survivors.mutate(np.flatnonzero(np.random.random(count) < self.mutate_prob))
+            ranked_population = self.rank_population(children.concat(survivors))
+
+        return ranked_population.individuals()[0]
+
+    def rank_population(self, population: Population) -> Population:
+        """ranking_phase over the views, then rows are reordered to match"""
+        individuals = population.individuals()
+        id2row = {id(individual): row for row, individual in enumerate(individuals)}
+        ranked = self.ranking_phase(individuals)
+        return population.take([id2row[id(individual)] for individual in ranked])
+
     def crossover_phase(self, ranked_population: list[Individual]) -> list[Individual]:
         parents = random.choices(
             ranked_population,
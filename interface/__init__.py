@@ -1,8 +1,19 @@
-from .cli import CliInterface
-from .pygame_interface import PygameInterface
-
+import importlib
 
 __all__ = (
     "CliInterface",
     "PygameInterface",
 )
+
+# modules of the interfaces, imported on first access: pygame is loaded only when PygameInterface is used
+_interface2module = {
+    "CliInterface": ".cli",
+    "PygameInterface": ".pygame_interface",
+}
+
+
+def __getattr__(name):
+    if name not in _interface2module:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    return getattr(importlib.import_module(_interface2module[name], __name__), name)
@@ -1,31 +1,116 @@
 import attr
 import itertools
+import logging
+import sys
+import time
+import typing
+import unicodedata
 
 from rules import Board, Bonus, Player
-from simulation import Simulator, TurnDescription
+from simulation import SimulationHistory, Simulator, TurnDescription
+
+logger = logging.getLogger(__name__)
+
+RENDER_MODES = ("full", "diff", "summary")
+
+
+def _text_width(text: str) -> int:
+    """Terminal columns taken by the text, wide characters like the player emoji take two"""
+    return sum(2 if unicodedata.east_asian_width(char) in "WF" else 1 for char in text)
 
 
 @attr.s(slots=True, kw_only=True)
 class CliInterface:
     board: Board = attr.ib()
     simulator: Simulator = attr.ib()
+    # play without input: num_of_games whole games, stopping early after max_steps steps in total
+    batch: bool = attr.ib(default=False)
+    num_of_games: int = attr.ib(default=1)
+    max_steps: typing.Optional[int] = attr.ib(default=None)
+    # full - the board after every step, diff - only the changed cells, redrawn in place with ANSI escapes,
+    # summary - only the results of every game
+    render_mode: str = attr.ib(default="full", validator=attr.validators.in_(RENDER_MODES))
+    output: typing.TextIO = attr.ib(factory=lambda: sys.stdout)
+    # cell texts on the terminal in diff mode, None before the first frame
+    _shown: typing.Optional[list[list[str]]] = attr.ib(default=None, init=False)
+    # columns of a cell in diff mode, the longest text shown so far and a space
+    _cell_width: int = attr.ib(default=0, init=False)
 
     def start_loop(self):
+        if self.batch:
+            self.run_batch()
+            return
+
+        print("Enter - next step, b - step back, j N - jump to step N, q - quit")
+        self.render()
+        while True:
+            match input().split():  # noqa
+                case ["b"]:
+                    self.seek(self.simulator.cur_step - 1)
+                case ["j", step] if step.isdigit():
+                    self.seek(int(step))
+                case ["q"]:
+                    break
+                case _:
+                    if self.simulator.is_endgame:
+                        break
+
+                    print(f"Step {self.simulator.cur_step}:")
+                    turn_desc = self.simulator.step()
+                    self.render_turn_desc(turn_desc)
+                    self.render()
+
+    def run_batch(self):
+        num_of_steps = 0
+        for game in range(self.num_of_games):
+            if game:
+                self.new_game()
+
+            start = time.perf_counter()
+            self.render_frame()
+            while not self.simulator.is_endgame and (self.max_steps is None or num_of_steps < self.max_steps):
+                self.simulator.step()
+                num_of_steps += 1
+                self.render_frame()
+
+            self.write(self.format_summary(game, time.perf_counter() - start))
+            if self.max_steps is not None and num_of_steps >= self.max_steps:
+                break
+
+    def new_game(self):
+        """Restarts the board with a fresh simulator, only the first game goes to the configured history"""
+        self.board.restart()
+        self.simulator = attr.evolve(self.simulator, board=self.board, simulation_hist=SimulationHistory(mode="none"))
+        self._shown = None
+        self._cell_width = 0
+
+    def seek(self, step: int):
+        try:
+            self.simulator.seek(max(step, 0))
+        except ValueError as e:
+            logger.warning("Can't seek: %s", e)
+            return
+
+        self.board = self.simulator.board
+        print(f"After step {self.simulator.cur_step}:")
         self.render()
-        while not self.simulator.is_endgame:
-            input()
-            print(f"Step {self.simulator.cur_step}:")
-            turn_desc = self.simulator.step()
-            self.render_turn_desc(turn_desc)
-            self.render()
+
+    def write(self, text: str):
+        self.output.write(text)
+        self.output.flush()
 
     def render_turn_desc(self, turn_desc: TurnDescription):
-        for player_name, move in itertools.chain(turn_desc.shoots, turn_desc.direct_moves):
-            player = self.board.get_player(player_name)
-            print(f"{player} make move {move}")
+        self.write(
+            "".join(
+                f"{self.board.get_player(player_name)} make move {move}\n"
+                for player_name, move in itertools.chain(turn_desc.shoots, turn_desc.direct_moves)
+            )
+        )
 
-    def render(self):
+    def cell_texts(self) -> list[list[str]]:
+        texts = []
         for y in range(self.board.size_y):
+            row = []
             for x in range(self.board.size_x):
                 cell = self.board.get_cell(x, y)
                 name = cell.__class__.__name__ if cell is not None else "."
@@ -35,5 +120,56 @@ class CliInterface:
                 if isinstance(cell, Player):
                     name = f"{cell.health}|{cell.score}"
                     name = "🎅" + name
-                print(name, end="\t")
-            print()
+                row.append(name)
+            texts.append(row)
+        return texts
+
+    def render(self):
+        """The whole board in one write"""
+        self.write("".join("\t".join(row) + "\t\n" for row in self.cell_texts()))
+
+    def render_diff(self):
+        """Redraws in place the cells which changed since the last frame.
+
+        Cells are padded to the longest text, the first frame and a frame with a longer text redraw the screen
+        """
+        texts = self.cell_texts()
+        widths = [[_text_width(text) for text in row] for row in texts]
+        longest = max(map(max, widths))
+        parts = []
+        if self._shown is None or longest >= self._cell_width:
+            self._cell_width = longest + 1
+            parts.append("\x1b[2J\x1b[H")
+            for row, row_widths in zip(texts, widths):
+                parts.extend(text + " " * (self._cell_width - width) for text, width in zip(row, row_widths))
+                parts.append("\n")
+        else:
+            for y, (row, shown_row) in enumerate(zip(texts, self._shown)):
+                for x, (text, shown_text) in enumerate(zip(row, shown_row)):
+                    if text != shown_text:
+                        # cursor positions are 1-based, the old text is blanked first
+                        position = f"\x1b[{y + 1};{x * self._cell_width + 1}H"
+                        parts.append(f"{position}{' ' * (self._cell_width - 1)}{position}{text}")
+
+        parts.append(f"\x1b[{len(texts) + 1};1H\x1b[KStep {self.simulator.cur_step}\n")
+        self._shown = texts
+        self.write("".join(parts))
+
+    def render_frame(self):
+        match self.render_mode:  # noqa
+            case "full":
+                self.write(f"Step {self.simulator.cur_step}:\n")
+                self.render()
+            case "diff":
+                self.render_diff()
+
+    def format_summary(self, game: int, seconds: float) -> str:
+        lines = [
+            f"Game {game}: {self.simulator.cur_step} steps in {seconds:.3f} s "
+            f"({self.simulator.cur_step / max(seconds, 1e-9):.1f} steps/s)"
+        ]
+        name2strategy = {strategy.player_name: strategy for strategy in self.simulator.strategies}
+        for player in self.simulator.players:
+            strategy_name = type(name2strategy[player.name]).__name__
+            lines.append(f"{player.name:>16} {strategy_name:>24} health {player.health:>4} score {player.score:>5}")
+        return "\n".join(lines) + "\n"
@@ -1,14 +1,21 @@
 import attr
 import logging
+import numpy as np
+import numpy.typing as npt
 import pygame
+import queue
+import threading
+import typing
 
 from rules import *  # noqa
-from rules import BaseObject
+from rules import kind2bonus
 from simulation import Simulator
 
 logger = logging.getLogger(__name__)
 
 MAX_FPS = 30
+# health bars are drawn in this many steps, so that a player surface can be cached
+HEALTH_BUCKETS = 10
 
 
 @attr.s(slots=True, kw_only=True)
@@ -28,12 +35,35 @@ class PygameInterface:
 
     autorun: bool = attr.ib()
     fps: int = attr.ib()
+    # PageUp/PageDown jump this many steps
+    seek_steps: int = attr.ib(default=10)
+    # digits typed before G, the step to jump to
+    _typed_step: str = attr.ib(default="", init=False)
+    # the simulation runs ahead of the screen in a thread, by up to this many steps
+    queue_size: int = attr.ib(default=64)
+    # show only the newest computed step instead of every one, toggled with F
+    fast_forward: bool = attr.ib(default=False)
+    # steps before this one are skipped like in fast_forward, e.g. to watch only the end of a long game
+    fast_forward_to: typing.Optional[int] = attr.ib(default=None)
+
+    # (step, cell keys) of the steps computed by the simulation thread and not shown yet
+    _frames: queue.Queue = attr.ib(default=None, init=False)
+    _simulation: typing.Optional[threading.Thread] = attr.ib(default=None, init=False)
+    _stop_simulation: threading.Event = attr.ib(factory=threading.Event, init=False)
+    _shown_step: int = attr.ib(default=0, init=False)
+    _shown_keys: npt.NDArray[np.int32] = attr.ib(default=None, init=False)
+    # steps asked with Enter while paused which are not computed yet
+    _requested_steps: int = attr.ib(default=0, init=False)
 
     player_surf: pygame.Surface = attr.ib(default=None, init=False)
     dead_surf: pygame.Surface = attr.ib(default=None, init=False)
     empty_surf: pygame.Surface = attr.ib(default=None, init=False)
     wall_surf: pygame.Surface = attr.ib(default=None, init=False)
     kind_bonus2surf: dict[type, dict[int, pygame.Surface]] = attr.ib(default=None, init=False)
+    # composed cell surfaces by cell key, see _cell_keys
+    _key2surf: dict[int, pygame.Surface] = attr.ib(factory=dict, init=False)
+    # keys of the cells on the screen, None when the whole screen has to be redrawn
+    _drawn_keys: npt.NDArray[np.int32] | None = attr.ib(default=None, init=False)
 
     @cell_size.default
     def _(self):
@@ -62,55 +92,172 @@ class PygameInterface:
             ScoreBonus: {value: self.load_cell_image(f"images/exp_x{value}.png") for value in range(1, 4)},
         }
 
+    def _simulate(self):
+        """Body of the simulation thread: steps the game and queues the cell keys of every step"""
+        try:
+            while not self.simulator.is_endgame and not self._stop_simulation.is_set():
+                self.simulator.step()
+                frame = self.simulator.cur_step, self._cell_keys()
+                while not self._stop_simulation.is_set():
+                    try:
+                        self._frames.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+        except Exception:
+            logger.exception("Simulation failed")
+
+    def _start_simulation(self):
+        """Shows the current state of the simulator and lets the simulation thread continue from it"""
+        self._shown_step, self._shown_keys = self.simulator.cur_step, self._cell_keys()
+        self._frames = queue.Queue(maxsize=self.queue_size)
+        self._stop_simulation.clear()
+        self._simulation = threading.Thread(target=self._simulate, name="simulation", daemon=True)
+        self._simulation.start()
+
+    def _join_simulation(self):
+        """Stops the simulation thread and forgets the steps it computed ahead"""
+        self._stop_simulation.set()
+        self._simulation.join()
+        self._requested_steps = 0
+
+    def _is_fast_forward(self) -> bool:
+        return self.fast_forward or (self.fast_forward_to is not None and self._shown_step < self.fast_forward_to)
+
+    def _is_simulation_over(self) -> bool:
+        """The game ended and all its steps are on the screen"""
+        return not self._simulation.is_alive() and self._frames.empty()
+
+    def _take_frames(self, limit: typing.Optional[int]) -> bool:
+        """Moves up to limit (all if None) computed steps to the screen, returns whether any were taken"""
+        frame = None
+        while limit is None or limit > 0:
+            try:
+                frame = self._frames.get_nowait()
+            except queue.Empty:
+                break
+            if limit is not None:
+                limit -= 1
+            if not self.fast_forward and self.fast_forward_to is not None and frame[0] >= self.fast_forward_to:
+                break
+
+        if frame is None:
+            return False
+
+        self._shown_step, self._shown_keys = frame
+        return True
+
     def start_loop(self):
         clock = pygame.time.Clock()
         running = True
+        caption = None
+        self._start_simulation()
         while running:
-            next_step = False
-            for event in pygame.event.get():
+            # nothing changes on a paused board until a key is pressed, so sleep till the next event
+            idle = not (self.autorun or self._requested_steps or self._is_fast_forward())
+            events = [pygame.event.wait(), *pygame.event.get()] if idle else pygame.event.get()
+            for event in events:
                 match event.type:  # noqa
                     case pygame.QUIT:
                         running = False
+                    case pygame.WINDOWEXPOSED | pygame.VIDEOEXPOSE:
+                        self._drawn_keys = None
                     case pygame.KEYDOWN:
                         match event.key:  # noqa
                             case pygame.K_ESCAPE:
                                 running = False
                             case pygame.K_RETURN | pygame.K_n:
-                                next_step = True
+                                self._requested_steps += 1
                                 self.autorun = False
                             case pygame.K_SPACE:
                                 self.autorun = not self.autorun
+                            case pygame.K_f:
+                                self.fast_forward = not self.fast_forward
                             case pygame.K_a:
                                 self.fps = max(1, self.fps - 1)
                             case pygame.K_s:
                                 self.fps = min(MAX_FPS, self.fps + 1)
+                            case pygame.K_LEFT | pygame.K_b:
+                                self.autorun = False
+                                self.seek(self._shown_step - 1)
+                            case pygame.K_PAGEUP:
+                                self.seek(self._shown_step - self.seek_steps)
+                            case pygame.K_PAGEDOWN:
+                                self.seek(max(self._shown_step, self.fast_forward_to or 0) + self.seek_steps)
+                            case pygame.K_HOME:
+                                self.seek(0)
+                            case pygame.K_g if self._typed_step:
+                                self.autorun = False
+                                self.seek(int(self._typed_step))
+                                self._typed_step = ""
+                            case _ if event.unicode.isdigit():
+                                self._typed_step += event.unicode
 
-            if self.autorun:
+            if self._is_fast_forward():
+                self._take_frames(None)
+                # a game which ends before fast_forward_to (everybody died) leaves nothing to wait for
+                if self.fast_forward_to is not None and self._is_simulation_over():
+                    self.fast_forward_to = None
+                clock.tick(MAX_FPS)
+            elif self.autorun:
+                self._take_frames(1)
                 clock.tick(self.fps)
-                next_step = True
-
-            if next_step and not self.simulator.is_endgame:
-                # logger.warning("step")
-                self.simulator.step()
+            elif self._requested_steps:
+                if self._take_frames(1):
+                    self._requested_steps -= 1
+                clock.tick(MAX_FPS)
 
-            self.render()
-            pygame.display.flip()
+            pygame.display.update(self.render(self._shown_keys))
+            if caption != (caption := f"Step {self._shown_step} {self._typed_step}"):
+                pygame.display.set_caption(caption)
 
+        self._join_simulation()
         pygame.quit()
 
-    def _render_cell(self, cell: BaseObject) -> pygame.Surface:
+    def seek(self, step: int):
+        if step > self._shown_step:
+            # the simulation thread is already on its way there, the game doesn't go past num_of_steps
+            self.fast_forward_to = min(step, self.simulator.num_of_steps)
+            return
+
+        self.fast_forward_to = None
+        self._join_simulation()
+        try:
+            self.simulator.seek(max(step, 0))
+        except ValueError as e:
+            logger.warning("Can't seek: %s", e)
+        self.board = self.simulator.board
+        self._start_simulation()
+
+    def _health_bucket(self, health, max_health):
+        """0 for a dead player, 1..HEALTH_BUCKETS for a living one"""
+        return np.where(health > 0, np.clip(-(-health * HEALTH_BUCKETS // max_health), 1, HEALTH_BUCKETS), 0)
+
+    def _cell_keys(self) -> npt.NDArray[np.int32]:
+        """kind << 8 | bonus value or health bucket of a player for every cell, cells with equal keys look the same"""
+        arrays = self.board.pack_arrays()
+        keys = arrays.kinds.astype(np.int32) << 8
+        is_bonus = (arrays.kinds >= CellKind.HEAL_BONUS) & (arrays.kinds <= CellKind.SCORE_BONUS)
+        keys[is_bonus] |= arrays.values[is_bonus]
+        is_player = arrays.kinds == CellKind.PLAYER
+        health = arrays.player_health[arrays.player_ids[is_player]]
+        keys[is_player] |= self._health_bucket(health, self.board.max_health).astype(np.int32)
+        return keys
+
+    def _render_cell(self, key: int) -> pygame.Surface:
+        kind, low = CellKind(key >> 8), key & 0xFF
         surf = self.empty_surf.copy()
-        match cell:  # noqa
-            case Bonus():
-                surf.blit(self.kind_bonus2surf[type(cell)][cell.value], (0, 0))
-            case Player():
-                if not cell.is_alive:
+        match kind:  # noqa
+            case CellKind.HEAL_BONUS | CellKind.POISON_BONUS | CellKind.SCORE_BONUS:
+                surf.blit(self.kind_bonus2surf[kind2bonus[kind]][low], (0, 0))
+            case CellKind.PLAYER:
+                if not low:
                     surf.blit(self.dead_surf, (0, 0))
                     return surf
 
                 surf.blit(self.player_surf, (0, 0))
 
-                hp_frac = cell.health / cell.max_health
+                hp_frac = low / HEALTH_BUCKETS
                 hp_color = (
                     int(min(255, 255 * 2 * (1 - hp_frac))),
                     int(min(255, 255 * 2 * hp_frac)),
@@ -128,22 +275,37 @@ class PygameInterface:
                     width=1,
                 )
 
-            case Wall():
+            case CellKind.WALL:
                 surf.blit(self.wall_surf, (0, 0))
-            case None:
+            case CellKind.EMPTY:
                 pass
-            case _:
-                logger.error("Unknown cell type %s", cell)
 
         return surf
 
-    def render(self):
-        self.screen.fill("black")
-        for board_y in range(self.board.size_y):
-            for board_x in range(self.board.size_x):
-                cell = self.board.get_cell(board_x, board_y)
-                surf = self._render_cell(cell)
+    def render(self, keys: typing.Optional[npt.NDArray[np.int32]] = None) -> list[pygame.Rect]:
+        """Draws the cells which changed since the last frame and returns their rects for display.update.
+
+        keys are the cell keys to show, the current board by default.
+        """
+        if keys is None:
+            keys = self._cell_keys()
+        dirty = []
+        if self._drawn_keys is None or self._drawn_keys.shape != keys.shape:
+            self.screen.fill("black")
+            dirty.append(self.screen.get_rect())
+            changed = np.ones(keys.shape, dtype=np.bool_)
+        else:
+            changed = keys != self._drawn_keys
+
+        for board_y, board_x in zip(*map(np.ndarray.tolist, np.nonzero(changed))):
+            key = int(keys[board_y, board_x])
+            surf = self._key2surf.get(key)
+            if surf is None:
+                surf = self._key2surf[key] = self._render_cell(key)
+
+            x = self.border_x + self.cell_size * board_x + self.border_between_cells * board_x
+            y = self.border_y + self.cell_size * board_y + self.border_between_cells * board_y
+            dirty.append(self.screen.blit(surf, (x, y)))
 
-                x = self.border_x + self.cell_size * board_x + self.border_between_cells * board_x
-                y = self.border_y + self.cell_size * board_y + self.border_between_cells * board_y
-                self.screen.blit(surf, (x, y))
+        self._drawn_keys = keys
+        return dirty
@@ -0,0 +1,304 @@
+import copy
+import itertools
+import json
+import logging
+import numpy as np
+import platform
+import random
+import sys
+import time
+import typing
+import yaml
+
+import util as lib_util
+
+from main_train import board_config, individual_factory, play_games
+from rules import SHOOT_DIRECTIONS, Board
+from simulation import SimulationHistory, Simulator
+from strategies import strategies_registrant
+from strategies.core import BaseStrategy, RandomStrategy
+
+logger = logging.getLogger(__name__)
+
+# results measured in these units are better when higher, the rest (latencies) when lower
+HIGHER_IS_BETTER_UNITS = ("ops/s", "steps/s", "games/s")
+
+Result = dict[str, typing.Any]
+
+
+def spread(values: list[float], best: float) -> float:
+    """Relative distance of the median of repeated measurements from the best one, the noise of a result"""
+    return abs(float(np.median(values)) - best) / best if best else 0.0
+
+
+def measure_throughput(setup: typing.Callable, run: typing.Callable, min_time: float) -> Result:
+    """Operations per second of run(setup()), run returns the number of operations. Setup isn't timed.
+
+    Runs for at least min_time and at least 5 times. Noise only slows a run down, so the value is the best rate,
+    and its spread tells how far the runs were from it.
+    """
+    rates, total_time = [], 0.0
+    while total_time < min_time or len(rates) < 5:
+        state = setup()
+        start = time.perf_counter()
+        ops = run(state)
+        elapsed = time.perf_counter() - start
+        rates.append(ops / elapsed)
+        total_time += elapsed
+
+    return {"value": max(rates), "spread": spread(rates, max(rates))}
+
+
+def make_board(size: int, num_of_players: int, item_density: float, storage: str, **kwargs) -> Board:
+    """Square board of the given side with walls on the border"""
+    return Board(
+        size_x=size,
+        size_y=size,
+        num_of_items=int(item_density * (size - 2) ** 2),
+        max_health=10,
+        player_names=[f"p{i}" for i in range(num_of_players)],
+        storage=storage,
+        **kwargs,
+    )
+
+
+def make_simulator(board: Board, strategies: list[BaseStrategy], num_of_steps: int) -> Simulator:
+    return Simulator(
+        board=board,
+        strategies=strategies,
+        num_of_steps=num_of_steps,
+        simulation_hist=SimulationHistory(mode="none"),
+        readonly_state=False,
+    )
+
+
+def bench_engine(
+    sizes: list[int],
+    players: list[int],
+    item_densities: list[float],
+    storages: list[str],
+    num_of_calls: int,
+    num_of_steps: int,
+    min_time: float,
+) -> dict[str, Result]:
+    """Board.restart, handle_shoot, handle_direct_move and Simulator.step with RandomStrategy"""
+    results = {}
+    for size, num_of_players, item_density, storage in itertools.product(sizes, players, item_densities, storages):
+        board = make_board(size, num_of_players, item_density, storage)
+        suffix = f"{size}x{size}/players={num_of_players}/items={item_density}/{storage}"
+
+        def random_calls(directions):
+            def setup():
+                calls = [(random.choice(board.player_names), *random.choice(directions)) for _ in range(num_of_calls)]
+                return copy.deepcopy(board), calls
+
+            return setup
+
+        def run_calls(method_name):
+            def run(board__calls):
+                board, calls = board__calls
+                method = getattr(board, method_name)
+                for player_name, dx, dy in calls:
+                    method(player_name, dx, dy)
+                return len(calls)
+
+            return run
+
+        def run_steps(simulator):
+            while not simulator.is_endgame:
+                simulator.step()
+            return simulator.cur_step
+
+        results[f"engine/handle_shoot/{suffix}"] = {
+            **measure_throughput(random_calls(SHOOT_DIRECTIONS), run_calls("handle_shoot"), min_time),
+            "unit": "ops/s",
+        }
+        direct_moves = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+        results[f"engine/handle_direct_move/{suffix}"] = {
+            **measure_throughput(random_calls(direct_moves), run_calls("handle_direct_move"), min_time),
+            "unit": "ops/s",
+        }
+        results[f"engine/restart/{suffix}"] = {
+            **measure_throughput(lambda: board, lambda board: board.restart() or 1, min_time),
+            "unit": "ops/s",
+        }
+        results[f"engine/step/{suffix}"] = {
+            **measure_throughput(
+                lambda: make_simulator(
+                    copy.deepcopy(board),
+                    [RandomStrategy(player_name=player_name) for player_name in board.player_names],
+                    num_of_steps,
+                ),
+                run_steps,
+                min_time,
+            ),
+            "unit": "steps/s",
+        }
+
+    return results
+
+
+def bench_strategies(
+    board: dict,
+    strategies: list[str],
+    num_of_steps: int,
+    strategy_configs: dict[str, dict],
+    storages: typing.Optional[list[str]] = None,
+    repeats: int = 3,
+) -> dict[str, Result]:
+    """p50 and p99 of get_next_move, every player of a game uses the same strategy class.
+
+    With storages every strategy is measured on boards of each storage, otherwise on the storage of board.
+    Every strategy plays repeats games, the value is the best of their percentiles and the spread their noise.
+    """
+    results = {}
+    for strategy_name, storage in itertools.product(strategies, storages or [None]):
+        strategy_cls = strategies_registrant.get_participant(strategy_name)
+        strategy_config = strategy_configs.get(strategy_name, {})
+        percentiles = [
+            np.percentile(strategy_latencies(strategy_cls, strategy_config, board, storage, num_of_steps), [50, 99])
+            * 1e6
+            for _ in range(repeats)
+        ]
+
+        prefix = f"strategy/{strategy_name}" if storage is None else f"strategy/{strategy_name}/{storage}"
+        for name, values in zip(("p50", "p99"), zip(*percentiles)):
+            results[f"{prefix}/{name}"] = {"value": min(values), "spread": spread(values, min(values)), "unit": "us"}
+
+    return results
+
+
+def strategy_latencies(
+    strategy_cls: type, strategy_config: dict, board: dict, storage: typing.Optional[str], num_of_steps: int
+) -> list[float]:
+    """Seconds of every get_next_move of a game"""
+    game_board = Board(**board) if storage is None else Board(**dict(board, storage=storage))
+    simulator = make_simulator(
+        game_board,
+        [strategy_cls(player_name=player_name, **strategy_config) for player_name in game_board.player_names],
+        num_of_steps,
+    )
+
+    latencies = []
+    while not simulator.is_endgame:
+        simulator.start_turn()
+        requests = simulator.get_requests()
+        moves = []
+        for _, strategy, state in requests:
+            start = time.perf_counter()
+            moves.append(strategy.get_next_move(state))
+            latencies.append(time.perf_counter() - start)
+
+        turn_desc = simulator.record_turn([player for player, _, _ in requests], moves)
+        simulator.handle_shoots(turn_desc.shoots)
+        simulator.handle_direct_moves(turn_desc.direct_moves)
+        simulator.finish_step()
+
+    return latencies
+
+
+def bench_training(config: dict, num_of_games: int, batch_games: list[bool], min_time: float) -> dict[str, Result]:
+    """Games per second of the main_train ranking, on the Board and Simulator sections of a training config"""
+    with open(config) as fin:
+        train_config = yaml.safe_load(fin)
+
+    num_of_players = len(Board(**train_config["Board"]).player_names)
+    individual_config = train_config.get("NeuralStrategy", {})
+
+    def random_samples():
+        return [[individual_factory(**individual_config) for _ in range(num_of_players)] for _ in range(num_of_games)]
+
+    results = {}
+    for batch in batch_games:
+        prototype_board = Board(**board_config(train_config, batch))
+        results[f"training/play_games/batch_games={batch}"] = {
+            **measure_throughput(
+                random_samples,
+                lambda samples: len(play_games(train_config, prototype_board, samples, batch)) // num_of_players,
+                min_time,
+            ),
+            "unit": "games/s",
+        }
+
+    return results
+
+
+def compare(
+    results: dict[str, Result], baseline: dict[str, Result], max_regression: float
+) -> tuple[list[str], list[str]]:
+    """Prints the change of every result found in the baseline, returns names of regressions and noisy results.
+
+    A change within the spread of the two measurements is noise: a result regresses only when it got worse by
+    more than max_regression plus that spread. Results whose spread alone exceeds max_regression are noisy,
+    they are printed separately and never counted as regressions.
+    """
+    regressions, noisy = [], []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        old, new = baseline[name]["value"], result["value"]
+        change = (new - old) / old if old else 0.0
+        if result["unit"] not in HIGHER_IS_BETTER_UNITS:
+            change = -change
+
+        noise = max(result.get("spread", 0.0), baseline[name].get("spread", 0.0))
+        if noise > max_regression:
+            status = "noisy"
+            noisy.append(name)
+        elif change < -(max_regression + noise):
+            status = "REGRESSION"
+            regressions.append(name)
+        else:
+            status = "ok"
+        print(f"{status:>10} {change:+8.1%} ±{noise:6.1%} {old:12.1f} -> {new:12.1f} {result['unit']} {name}")
+
+    if noisy:
+        print(f"{len(noisy)} results are too noisy to compare, spread over {max_regression:.0%}:")
+        print("".join(f"  {name}\n" for name in noisy), end="")
+    return regressions, noisy
+
+
+def main():
+    config = lib_util.get_config()
+    random.seed(config.get("seed", 0))
+    np.random.seed(config.get("seed", 0))
+    min_time = config.get("min_time", 0.2)
+
+    results = {}
+    if "Engine" in config:
+        results.update(bench_engine(min_time=min_time, **config["Engine"]))
+    if "Strategies" in config:
+        results.update(bench_strategies(strategy_configs=config, **config["Strategies"]))
+    if "Training" in config:
+        results.update(bench_training(min_time=min_time, **config["Training"]))
+
+    for name, result in results.items():
+        print(f"{result['value']:12.1f} {result['unit']:8} ±{result['spread']:6.1%} {name}")
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "results": results,
+    }
+    if config.get("output"):
+        with open(config["output"], "w") as fout:
+            json.dump(report, fout, indent=2)
+
+    if config.get("baseline"):
+        with open(config["baseline"]) as fin:
+            baseline = json.load(fin)["results"]
+
+        regressions, _ = compare(results, baseline, config.get("max_regression", 0.2))
+        if regressions:
+            logger.error("%s results regressed more than %s", len(regressions), config.get("max_regression", 0.2))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
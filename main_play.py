@@ -1,10 +1,12 @@
 import copy
 import logging
+import random
 
+import interface as lib_interface
 import util as lib_util
 
-from interface import CliInterface, PygameInterface  # noqa: F401
 from rules import Board
+from sandbox import StrategySandbox
 from simulation import Simulator, SimulationHistory
 from strategies.core import BaseStrategy
 from strategies import strategies_registrant
@@ -12,12 +14,26 @@ from strategies import strategies_registrant
 logger = logging.getLogger(__name__)
 
 
+def load_simulation_history(config) -> SimulationHistory:
+    history_config = config.get("SimulationHistory", {})
+    stream_path = (config.get("load_stream") or {}).get("SimulationHistory")
+    if stream_path:
+        return SimulationHistory.read_stream(stream_path, **history_config)
+
+    return lib_util.load_pickle_or_init(config, SimulationHistory)
+
+
 def main():
     config = lib_util.get_config()
 
-    simulation_hist = lib_util.load_pickle_or_init(config, SimulationHistory)
-    simulation_hist.initial_board = simulation_hist.initial_board or Board(**config["Board"])
-    board = copy.deepcopy(simulation_hist.initial_board)
+    simulation_hist = load_simulation_history(config)
+    if simulation_hist.board_config is None:
+        # the history keeps the seed instead of the board, so a game without a seed gets one
+        board_config = dict(config["Board"])
+        if board_config.get("seed") is None:
+            board_config["seed"] = random.randrange(2**32)
+        simulation_hist.board_config = board_config
+    board = Board(**simulation_hist.board_config)
 
     strategies = []
     if "fixed_strategies" in config:
@@ -44,21 +60,30 @@ def main():
     else:
         raise NotImplementedError("You must define fixed_strategies in config")
 
-    simulator = Simulator(
-        board=board,
-        strategies=strategies,
-        simulation_hist=simulation_hist,
-        **config["Simulator"],
-    )
-    interface_class_name = config["main_interface"]
-    interface_class = globals()[interface_class_name]
-    interface = interface_class(
-        board=board,
-        simulator=simulator,
-        **config.get(interface_class_name, {}),
-    )
-    interface.start_loop()
-    lib_util.dump_pickle_if_need(config, simulator.simulation_hist)
+    # untrusted strategies run in worker processes with a deadline per move
+    sandbox = StrategySandbox(**config["StrategySandbox"]) if "StrategySandbox" in config else None
+    try:
+        simulator = Simulator(
+            board=board,
+            strategies=strategies,
+            simulation_hist=simulation_hist,
+            sandbox=sandbox,
+            **config["Simulator"],
+        )
+        interface_class_name = config["main_interface"]
+        interface_class = getattr(lib_interface, interface_class_name)
+        interface = interface_class(
+            board=board,
+            simulator=simulator,
+            **config.get(interface_class_name, {}),
+        )
+        interface.start_loop()
+    finally:
+        # the stream file and the sandbox workers are released on errors and Ctrl+C too
+        simulation_hist.close()
+        if sandbox is not None:
+            sandbox.close()
+    lib_util.dump_pickle_if_need(config, simulation_hist)
 
 
 if __name__ == "__main__":
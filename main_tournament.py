@@ -0,0 +1,256 @@
+import attr
+import collections
+import copy
+import functools
+import itertools
+import json
+import logging
+import multiprocessing
+import numpy as np
+import pickle
+import random
+import time
+import typing
+
+import util as lib_util
+
+from rules import Board
+from simulation import SimulationHistory, Simulator
+from strategies import strategies_registrant
+from strategies.core import BaseStrategy
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("round_robin", "swiss")
+
+Result = dict[str, typing.Any]
+
+
+@functools.cache
+def _load_checkpoint(path: str) -> BaseStrategy:
+    # once per process, every game gets a deepcopy
+    with open(path, "rb") as fin:
+        return pickle.load(fin)
+
+
+@attr.s(slots=True, kw_only=True, frozen=True)
+class Participant:
+    name: str = attr.ib()
+    # class name in strategies_registrant
+    strategy: str = attr.ib()
+    # pickled strategy, e.g. a NeuralStrategy checkpoint of main_train, instead of a new instance
+    pickle_path: typing.Optional[str] = attr.ib(default=None)
+    # kwargs of a new instance
+    kwargs: dict = attr.ib(factory=dict)
+
+    @classmethod
+    def parse(cls, spec: str | dict, config: dict) -> "Participant":
+        """A class name, configured by the config section of the same name like in main_play, or a dict of fields"""
+        if isinstance(spec, str):
+            return cls(name=spec, strategy=spec, kwargs=config.get(spec, {}))
+
+        spec = dict(spec)
+        spec.setdefault("name", spec.get("pickle_path") or spec["strategy"])
+        return cls(**spec)
+
+    @strategy.validator
+    def _(self, attribute, value):
+        strategies_registrant.get_participant(value)
+
+    def make_strategy(self, player_name: str) -> BaseStrategy:
+        if self.pickle_path is not None:
+            strategy = copy.deepcopy(_load_checkpoint(self.pickle_path))
+        else:
+            strategy = strategies_registrant.get_participant(self.strategy)(**self.kwargs)
+        strategy.player_name = player_name
+        return strategy
+
+
+@attr.s(slots=True, kw_only=True)
+class EloRatings:
+    """Elo ratings of multiplayer games: every game is scored as all pairwise matches between its players"""
+
+    k: float = attr.ib(default=32.0)
+    initial: float = attr.ib(default=1500.0)
+    ratings: dict[str, float] = attr.ib(factory=dict)
+    num_of_games: collections.Counter = attr.ib(factory=collections.Counter)
+
+    def get(self, name: str) -> float:
+        return self.ratings.get(name, self.initial)
+
+    def update(self, points: dict[str, typing.Any]):
+        """points of every participant of a game, more is better, equal points are a draw"""
+        names = list(points)
+        deltas = dict.fromkeys(names, 0.0)
+        k = self.k / max(len(names) - 1, 1)
+        for first, second in itertools.combinations(names, 2):
+            expected = 1 / (1 + 10 ** ((self.get(second) - self.get(first)) / 400))
+            actual = 1.0 if points[first] > points[second] else 0.5 if points[first] == points[second] else 0.0
+            deltas[first] += k * (actual - expected)
+            deltas[second] -= k * (actual - expected)
+
+        for name, delta in deltas.items():
+            self.ratings[name] = self.get(name) + delta
+            self.num_of_games[name] += 1
+
+    def table(self) -> list[tuple[str, float, int]]:
+        return sorted(
+            ((name, rating, self.num_of_games[name]) for name, rating in self.ratings.items()),
+            key=lambda row: row[1],
+            reverse=True,
+        )
+
+
+def play_game(task: dict) -> Result:
+    """Plays one game of the task, runs in worker processes. A failed game is reported, not raised"""
+    result = {
+        "game": task["game"],
+        "round": task["round"],
+        "seed": task["board"]["seed"],
+        "participants": [participant.name for participant in task["participants"]],
+    }
+    random.seed(task["board"]["seed"])
+    np.random.seed(task["board"]["seed"])
+    start = time.perf_counter()
+    try:
+        board = Board(**task["board"])
+        strategies = [
+            participant.make_strategy(player_name)
+            for participant, player_name in zip(task["participants"], board.player_names)
+        ]
+        simulator = Simulator(
+            board=board, strategies=strategies, simulation_hist=SimulationHistory(mode="none"), **task["simulator"]
+        )
+        while not simulator.is_endgame:
+            simulator.step()
+    except Exception as e:
+        logger.exception("Game %s failed", task["game"])
+        result["error"] = repr(e)
+        return result
+
+    result["steps"] = simulator.cur_step
+    result["seconds"] = time.perf_counter() - start
+    result["players"] = [
+        {
+            "participant": participant.name,
+            "player_name": player.name,
+            "score": player.score,
+            "health": player.health,
+        }
+        for participant, player in zip(task["participants"], simulator.players)
+    ]
+    return result
+
+
+@attr.s(slots=True, kw_only=True)
+class Tournament:
+    """Plays games between participants on seeded boards and rates them with Elo as the games finish.
+
+    Every game has as many players as the Board section has player_names. round_robin plays every combination
+    of participants once, swiss plays `rounds` rounds where participants of close ratings meet, the ones left
+    over when the participants don't divide into games sit the round out. Every combination is played
+    games_per_matchup times on different boards with rotated seats. Results go to `output` line by line.
+    """
+
+    config: dict = attr.ib()
+    participants: list[Participant] = attr.ib()
+    format: str = attr.ib(default="round_robin", validator=attr.validators.in_(FORMATS))
+    rounds: int = attr.ib(default=3)
+    games_per_matchup: int = attr.ib(default=1)
+    # > 1 plays the games in a pool of worker processes
+    num_workers: int = attr.ib(default=1)
+    seed: int = attr.ib(default=0)
+    output: typing.Optional[str] = attr.ib(default="tournament.jsonl")
+    ratings: EloRatings = attr.ib(factory=EloRatings)
+    players_per_game: int = attr.ib(init=False)
+    _num_of_games: int = attr.ib(default=0, init=False)
+    _rng: random.Random = attr.ib(init=False)
+
+    @players_per_game.default
+    def _(self):
+        return len(Board(**self.config["Board"]).player_names)
+
+    @_rng.default
+    def _(self):
+        return random.Random(self.seed)
+
+    def __attrs_post_init__(self):
+        names = [participant.name for participant in self.participants]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Participant names must be unique: {names}")
+        if len(self.participants) < self.players_per_game:
+            raise ValueError(f"{len(self.participants)} participants is too few for games of {self.players_per_game}")
+
+    def schedule_round(self) -> list[tuple[Participant, ...]]:
+        if self.format == "round_robin":
+            return list(itertools.combinations(self.participants, self.players_per_game))
+
+        # random order first, so participants with equal ratings are paired differently every round
+        participants = self._rng.sample(self.participants, len(self.participants))
+        participants.sort(key=lambda participant: self.ratings.get(participant.name), reverse=True)
+        return list(lib_util.group(participants, self.players_per_game))
+
+    def make_tasks(self, matchups: list[tuple[Participant, ...]], round_index: int) -> list[dict]:
+        tasks = []
+        for matchup in matchups:
+            for repetition in range(self.games_per_matchup):
+                shift = repetition % len(matchup)
+                game = self._num_of_games
+                self._num_of_games += 1
+                seed = int(np.random.SeedSequence([self.seed, game]).generate_state(1)[0])
+                tasks.append(
+                    {
+                        "game": game,
+                        "round": round_index,
+                        "participants": matchup[shift:] + matchup[:shift],
+                        "board": {**self.config["Board"], "seed": seed},
+                        "simulator": self.config["Simulator"],
+                    }
+                )
+        return tasks
+
+    def record(self, result: Result, fout: typing.Optional[typing.TextIO]):
+        if "error" not in result:
+            self.ratings.update(
+                {player["participant"]: (player["score"], player["health"]) for player in result["players"]}
+            )
+            result["ratings"] = {name: round(self.ratings.get(name), 1) for name in result["participants"]}
+
+        if fout is not None:
+            fout.write(json.dumps(result) + "\n")
+            fout.flush()
+
+    def run(self) -> EloRatings:
+        num_of_rounds = 1 if self.format == "round_robin" else self.rounds
+        pool = multiprocessing.Pool(self.num_workers) if self.num_workers > 1 else None
+        fout = open(self.output, "w") if self.output is not None else None
+        try:
+            for round_index in range(num_of_rounds):
+                tasks = self.make_tasks(self.schedule_round(), round_index)
+                logger.info("Round %s: %s games", round_index, len(tasks))
+                results = pool.imap_unordered(play_game, tasks) if pool is not None else map(play_game, tasks)
+                for result in results:
+                    self.record(result, fout)
+        finally:
+            if fout is not None:
+                fout.close()
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        return self.ratings
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    config = lib_util.get_config()
+    tournament_config = dict(config["Tournament"])
+    participants = [Participant.parse(spec, config) for spec in tournament_config.pop("participants")]
+    ratings = Tournament(config=config, participants=participants, **tournament_config).run()
+
+    for place, (name, rating, num_of_games) in enumerate(ratings.table(), 1):
+        print(f"{place:4} {rating:8.1f} {num_of_games:6} {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,174 @@
 import attr
 import copy
+import functools
+import json
+import multiprocessing
+import numpy as np
+import random
+import typing
 
 import genetic
 import util as lib_util
 
-from strategies.neural_network import NeuralStrategy
+from strategies.neural_network import NeuralPopulation, NeuralStrategy
+from profiling import Profiler
 from rules import Board
-from simulation import Simulator
+from simulation import SimulationHistory, Simulator, VectorizedSimulator
+
+
+def individual_factory(**kwargs):
+    return NeuralStrategy(player_name="cock", **kwargs)
+
+
+def population_factory(size, **kwargs):
+    return NeuralPopulation.init(size, player_name="cock", **kwargs)
+
+
+def board_config(config: dict, batch_games: bool) -> dict:
+    """VectorizedSimulator needs array boards, so batch_games plays on them whatever storage the config has"""
+    return {**config["Board"], "storage": "arrays"} if batch_games else config["Board"]
+
+
+def play_games(
+    config: dict, prototype_board: Board, samples: list, batch_games: bool, profiler: typing.Optional[Profiler] = None
+) -> list[int]:
+    """Plays one game per sample on copies of prototype_board and returns scores of individuals in sample order"""
+    boards = []
+    for sample in samples:
+        board = copy.deepcopy(prototype_board)
+        for strategy, player_name in zip(sample, board.player_names):
+            strategy.player_name = player_name
+        boards.append(board)
+
+    # nobody reads the moves of training games, so by default they aren't kept
+    history_config = {"mode": "none", **config.get("SimulationHistory", {})}
+    if batch_games:
+        simulator = VectorizedSimulator(
+            boards=boards,
+            strategies=samples,
+            simulation_hists=[SimulationHistory(**history_config) for _ in boards],
+            profiler=profiler,
+            **config["Simulator"],
+        )
+        while not simulator.is_endgame:
+            simulator.step()
+    else:
+        for board, sample in zip(boards, samples):
+            simulator = Simulator(
+                board=board,
+                strategies=sample,
+                simulation_hist=SimulationHistory(**history_config),
+                profiler=profiler,
+                **config["Simulator"],
+            )
+            while not simulator.is_endgame:
+                simulator.step()
 
+    scores = []
+    for board, sample in zip(boards, samples):
+        for individual in sample:
+            player = board.get_player(individual.player_name)
+            scores.append(player.score if player.is_alive else -1)
 
-def individual_factory():
-    return NeuralStrategy(player_name="cock")
+    return scores
 
 
-@attr.s(slots=True, kw_only=True)
-class GeneticAlgorithm(genetic.GeneticAlgorithm):
-    config: dict = attr.ib()
+_worker_config: dict = None
 
-    def ranking_phase(self, population):
-        prototype_board = Board(**self.config["Board"])
-        assert self.population_size % len(prototype_board.player_names) == 0
 
-        score__individual = []
-        for sample in lib_util.group(population, len(prototype_board.player_names)):
-            board = copy.deepcopy(prototype_board)
-            for strategy, player_name in zip(sample, board.player_names):
-                strategy.player_name = player_name
+def _init_worker(config: dict, seed: int):
+    global _worker_config
+    random.seed(seed)
+    np.random.seed(seed)
+    _worker_config = config
 
-            simulator = Simulator(
-                board=board,
-                strategies=sample,
-                **self.config["Simulator"],
-            )
-            while not simulator.is_endgame:
-                simulator.step()
 
-            for individual in sample:
-                player = board.get_player(individual.player_name)
-                score = player.score if player.is_alive else -1
-                score__individual.append((score, individual))
+def _play_games_in_worker(
+    task_seed: int, prototype_board: Board, samples: list, batch_games: bool, profile: bool
+) -> tuple[list[int], typing.Optional[Profiler]]:
+    random.seed(task_seed)
+    np.random.seed(task_seed)
+    profiler = Profiler() if profile else None
+    return play_games(_worker_config, prototype_board, samples, batch_games, profiler), profiler
+
 
+@attr.s(slots=True, kw_only=True)
+class GeneticAlgorithm(genetic.GeneticAlgorithm):
+    config: dict = attr.ib()
+    # play all games of a generation in lockstep with VectorizedSimulator, on array boards
+    batch_games: bool = attr.ib(default=False)
+    # > 1 plays the games of a generation in a pool of worker processes
+    num_workers: int = attr.ib(default=1)
+    # seeds the main process and derives seeds of worker tasks
+    seed: typing.Optional[int] = attr.ib(default=None)
+
+    # timings of the simulation phases and strategies over the whole run are written to this JSON
+    profile_path: typing.Optional[str] = attr.ib(default=None)
+
+    _pool = attr.ib(default=None, init=False)
+    _generation: int = attr.ib(default=0, init=False)
+    _profiler: typing.Optional[Profiler] = attr.ib(default=None, init=False)
+
+    def run(self) -> genetic.Individual:
+        if self.seed is not None:
+            random.seed(self.seed)
+            np.random.seed(self.seed)
+
+        if self.profile_path is None:
+            return self._run_games()
+
+        self._profiler = Profiler()
+        try:
+            return self._run_games()
+        finally:
+            print(self._profiler.report())
+            with open(self.profile_path, "w") as fout:
+                json.dump(self._profiler.export(), fout, indent=2)
+
+    def _run_games(self) -> genetic.Individual:
+        if self.num_workers <= 1:
+            return super().run()
+
+        with multiprocessing.Pool(
+            self.num_workers, initializer=_init_worker, initargs=(self.config, self.seed or 0)
+        ) as pool:
+            self._pool = pool
+            try:
+                return super().run()
+            finally:
+                self._pool = None
+
+    def _play_games_in_pool(self, prototype_board: Board, samples: list) -> list[int]:
+        # contiguous chunks and per-chunk seeds depend only on the config, so the run is reproducible.
+        # Every task gets the board of the generation, so the games are the ones serial mode would play
+        num_chunks = min(self.num_workers, len(samples))
+        bounds = np.linspace(0, len(samples), num_chunks + 1).astype(int)
+        seeds = np.random.SeedSequence([self.seed or 0, self._generation]).generate_state(num_chunks)
+        results = self._pool.starmap(
+            _play_games_in_worker,
+            [
+                (int(seed), prototype_board, samples[start:end], self.batch_games, self._profiler is not None)
+                for seed, start, end in zip(seeds, bounds, bounds[1:])
+            ],
+        )
+        for _, profiler in results:
+            if profiler is not None:
+                self._profiler.merge(profiler)
+        return [score for chunk_scores, _ in results for score in chunk_scores]
+
+    def ranking_phase(self, population):
+        num_of_players = len(self.config["Board"]["player_names"])
+        assert self.population_size % num_of_players == 0
+
+        samples = list(lib_util.group(population, num_of_players))
+        prototype_board = Board(**board_config(self.config, self.batch_games))
+        if self._pool is not None:
+            scores = self._play_games_in_pool(prototype_board, samples)
+        else:
+            scores = play_games(self.config, prototype_board, samples, self.batch_games, self._profiler)
+        self._generation += 1
+
+        score__individual = list(zip(scores, population))
         score__individual.sort(key=lambda k: k[0], reverse=True)
         print([score for score, _ in score__individual])
         return [individual for _, individual in score__individual]
@@ -47,11 +176,17 @@ class GeneticAlgorithm(genetic.GeneticAlgorithm):
 
 def main():
     config = lib_util.get_config()
+    strategy_config = config.get("NeuralStrategy", {})
+
+    # tensor_population: keep the weights of the whole population in stacked tensors and evolve them at once
+    genetic_config = dict(config["GeneticAlgorithm"])
+    if genetic_config.pop("tensor_population", False):
+        genetic_config["population_factory"] = functools.partial(population_factory, **strategy_config)
 
     genetic_algorithm = GeneticAlgorithm(
-        individual_factory=individual_factory,
+        individual_factory=functools.partial(individual_factory, **strategy_config),
         config=config,
-        **config["GeneticAlgorithm"],
+        **genetic_config,
     )
     individual = genetic_algorithm.run()
     lib_util.dump_pickle_if_need(config, individual)
@@ -0,0 +1,120 @@
+import attr
+import contextlib
+import sys
+import time
+import typing
+
+__all__ = (
+    "Profiler",
+    "Timings",
+)
+
+# bucket i of a histogram counts durations in [2 ** (i - 1), 2 ** i) microseconds, bucket 0 is below 1us
+NUM_OF_BUCKETS = 32
+
+
+@attr.s(slots=True, kw_only=True)
+class Timings:
+    count: int = attr.ib(default=0)
+    total: float = attr.ib(default=0.0)
+    max: float = attr.ib(default=0.0)
+    histogram: list[int] = attr.ib(factory=lambda: [0] * NUM_OF_BUCKETS)
+    # net change of sys.getallocatedblocks(), only with Profiler.track_allocations
+    allocated_blocks: int = attr.ib(default=0)
+
+    def add(self, seconds: float, count: int = 1, allocated_blocks: int = 0):
+        """`count` calls which took `seconds` together, a batch is split evenly between its calls"""
+        per_call = seconds / count
+        self.count += count
+        self.total += seconds
+        self.max = max(self.max, per_call)
+        self.histogram[min(int(per_call * 1e6).bit_length(), NUM_OF_BUCKETS - 1)] += count
+        self.allocated_blocks += allocated_blocks
+
+    def merge(self, other: "Timings"):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        self.allocated_blocks += other.allocated_blocks
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the histogram bucket holding the q-th percentile, in seconds"""
+        threshold = q / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= threshold:
+                return 2**bucket / 1e6
+        return 0.0
+
+    def export(self) -> dict[str, typing.Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "allocated_blocks": self.allocated_blocks,
+            "histogram_us": {2**bucket: count for bucket, count in enumerate(self.histogram) if count},
+        }
+
+
+@attr.s(slots=True, kw_only=True)
+class Profiler:
+    """Cumulative timings and histograms of the simulation phases and of every strategy class.
+
+    Simulators take it as an optional `profiler` and don't measure anything without one. Profilers of
+    several simulators or processes are combined with merge, drivers read the results with export or report.
+    """
+
+    track_allocations: bool = attr.ib(default=False)
+    phases: dict[str, Timings] = attr.ib(factory=dict)
+    strategies: dict[str, Timings] = attr.ib(factory=dict)
+
+    @contextlib.contextmanager
+    def measure(self, timings: dict[str, Timings], name: str, count: int = 1):
+        blocks = sys.getallocatedblocks() if self.track_allocations else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.track_allocations:
+                blocks = sys.getallocatedblocks() - blocks
+            self.add(timings, name, elapsed, count, blocks)
+
+    def add(self, timings: dict[str, Timings], name: str, seconds: float, count: int = 1, allocated_blocks: int = 0):
+        """For durations measured elsewhere, e.g. in other threads"""
+        if name not in timings:
+            timings[name] = Timings()
+        timings[name].add(seconds, count, allocated_blocks)
+
+    def phase(self, name: str):
+        return self.measure(self.phases, name)
+
+    def strategy(self, name: str, count: int = 1):
+        return self.measure(self.strategies, name, count)
+
+    def merge(self, other: "Profiler"):
+        for timings, other_timings in ((self.phases, other.phases), (self.strategies, other.strategies)):
+            for name, value in other_timings.items():
+                timings.setdefault(name, Timings()).merge(value)
+
+    def export(self) -> dict[str, typing.Any]:
+        return {
+            "phases": {name: timings.export() for name, timings in self.phases.items()},
+            "strategies": {name: timings.export() for name, timings in self.strategies.items()},
+        }
+
+    def report(self) -> str:
+        lines = [f"{'':30} {'count':>10} {'total, s':>10} {'mean, us':>10} {'p99, us':>10} {'blocks':>10}"]
+        for kind, timings in (("phase", self.phases), ("strategy", self.strategies)):
+            for name, value in timings.items():
+                lines.append(
+                    f"{kind + ' ' + name:30} {value.count:10} {value.total:10.3f} "
+                    f"{value.total / max(value.count, 1) * 1e6:10.1f} {value.percentile(99) * 1e6:10.0f} "
+                    f"{value.allocated_blocks:10}"
+                )
+        return "\n".join(lines)
@@ -1,10 +1,21 @@
 import attr
+import bisect
+import copy
+import enum
 import functools
+import hashlib
 import logging
+import numpy as np
+import numpy.typing as npt
+import os
 from pathlib import Path
 import random
+import tempfile
+import types
 import typing
 
+from distances import DistanceField
+
 
 __all__ = (
     "PlayerName",
@@ -15,6 +26,12 @@ __all__ = (
     "PoisonBonus",
     "ScoreBonus",
     "Board",
+    "BoardArrays",
+    "BoardIsFullError",
+    "CellKind",
+    "LevelMap",
+    "LineOfSight",
+    "ObjectIndex",
     "State",
 )
 
@@ -22,8 +39,23 @@ __all__ = (
 logger = logging.getLogger(__name__)
 
 
+class CellKind(enum.IntEnum):
+    EMPTY = 0
+    WALL = 1
+    HEAL_BONUS = 2
+    POISON_BONUS = 3
+    SCORE_BONUS = 4
+    PLAYER = 5
+
+
+# plain ints for the hot paths, every access to a member goes through EnumType.__getattr__
+_EMPTY, _WALL, _HEAL_BONUS, _POISON_BONUS, _SCORE_BONUS, _PLAYER = map(int, CellKind)
+_BONUS_KINDS = frozenset((_HEAL_BONUS, _POISON_BONUS, _SCORE_BONUS))
+_BLOCKING_KINDS = frozenset((_WALL, _PLAYER))
+
+
 class BaseObject:
-    pass
+    kind = CellKind.EMPTY
 
 
 def only_if_alive(func):
@@ -41,6 +73,8 @@ class PlayerName(str):
 
 @attr.s(slots=True, kw_only=True)
 class Player(BaseObject):
+    kind = CellKind.PLAYER
+
     name: PlayerName = attr.ib()
     x: int = attr.ib()
     y: int = attr.ib()
@@ -78,8 +112,81 @@ class Player(BaseObject):
         self.y += dy
 
 
+def _read_only(array: npt.NDArray) -> npt.NDArray:
+    """Zero-copy view which raises on writes, the array itself stays writeable"""
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class _ScalarViews(tuple):
+    """Flat memoryviews of numpy arrays: reading or writing one element is several times cheaper than with numpy.
+
+    They are dropped when their owner is copied or pickled and made again on the next use.
+    """
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return type(None), ()
+
+
+def _scalar_views(*arrays: npt.NDArray) -> _ScalarViews:
+    """Views of C-contiguous arrays (raises on others), element [y, x] of a grid is at y * size_x + x"""
+    views = []
+    for array in arrays:
+        view = memoryview(array)
+        views.append(view.cast("B").cast(view.format))
+    return _ScalarViews(views)
+
+
+def _forget_views(instance, attribute, value):
+    """on_setattr hook of classes caching _scalar_views of their fields: a rebound array gets new views"""
+    instance._views = None
+    return value
+
+
+def _player_column(position: int) -> property:
+    def getter(self):
+        return self._arrays.scalar_views()[position][self.index]
+
+    def setter(self, value):
+        self._arrays.scalar_views()[position][self.index] = value
+
+    return property(getter, setter)
+
+
+class PlayerView(Player):
+    """Player of an array-backed Board: x, y, health and score live in the per-player columns of BoardArrays,
+    index is the column of the player
+    """
+
+    __slots__ = ("_arrays", "index")
+
+    x = _player_column(3)
+    y = _player_column(4)
+    health = _player_column(5)
+    score = _player_column(6)
+
+    def __init__(self, *, name: PlayerName, x: int, y: int, max_health: int, arrays: "BoardArrays", index: int):
+        self.name = name
+        self.max_health = max_health
+        self._arrays = arrays
+        self.index = index
+        self.x = x
+        self.y = y
+        self.reset()
+
+    def __getstate__(self):
+        return self.name, self.max_health, self._arrays, self.index
+
+    def __setstate__(self, state):
+        self.name, self.max_health, self._arrays, self.index = state
+
+
 @attr.s(slots=True, kw_only=True)
 class Wall(BaseObject):
+    kind = CellKind.WALL
     _singleton = None
 
     def __new__(cls):
@@ -88,6 +195,9 @@ class Wall(BaseObject):
 
         return cls._singleton
 
+    def __deepcopy__(self, memo):
+        return self
+
 
 @attr.s(slots=True, kw_only=True)
 class Item(BaseObject):
@@ -112,6 +222,7 @@ class Bonus(Item):
 
 @attr.s(slots=True, kw_only=True)
 class ScoreBonus(Bonus):
+    kind = CellKind.SCORE_BONUS
     # -3: 1, -2: 2, -1: 3
     _values__probs = tuple(zip(*{1: 3, 2: 2, 3: 1}.items()))
     repr_symbol = "💰"
@@ -122,6 +233,7 @@ class ScoreBonus(Bonus):
 
 @attr.s(slots=True, kw_only=True)
 class HealBonus(Bonus):
+    kind = CellKind.HEAL_BONUS
     _values__probs = tuple(zip(*{1: 3, 2: 2, 3: 1}.items()))
     repr_symbol = "🍏"
 
@@ -131,6 +243,7 @@ class HealBonus(Bonus):
 
 @attr.s(slots=True, kw_only=True)
 class PoisonBonus(Bonus):
+    kind = CellKind.POISON_BONUS
     _values__probs = tuple(zip(*{1: 3, 2: 2, 3: 1}.items()))
     repr_symbol = "💀"
 
@@ -138,15 +251,828 @@ class PoisonBonus(Bonus):
         player.damage(self.value)
 
 
+kind2bonus: dict[CellKind, type[Bonus]] = {
+    bonus_cls.kind: bonus_cls for bonus_cls in (HealBonus, PoisonBonus, ScoreBonus)
+}
+
+
+@attr.s(slots=True, kw_only=True, on_setattr=_forget_views)
+class BoardArrays:
+    """Struct-of-arrays representation of a board.
+
+    Grid layers are indexed as [y, x]:
+    * kinds - CellKind of every cell
+    * values - value of a bonus, 0 for other cells
+    * player_ids - index of the player standing in the cell, -1 if there is nobody
+
+    Per-player columns are indexed by the position of the player in player_names.
+    Arrays may be rebound to other arrays of the same shape (e.g. views into stacked ones), see scalar_views.
+    """
+
+    kinds: npt.NDArray[np.int8] = attr.ib()
+    values: npt.NDArray[np.int8] = attr.ib()
+    player_ids: npt.NDArray[np.int16] = attr.ib()
+    player_names: tuple[PlayerName, ...] = attr.ib(converter=tuple)
+    player_x: npt.NDArray[np.int16] = attr.ib()
+    player_y: npt.NDArray[np.int16] = attr.ib()
+    player_health: npt.NDArray[np.int32] = attr.ib()
+    player_score: npt.NDArray[np.int32] = attr.ib()
+    _name2index: dict[PlayerName, int] = attr.ib(init=False, repr=False, eq=False)
+    _views: typing.Optional[_ScalarViews] = attr.ib(
+        default=None, init=False, repr=False, eq=False, on_setattr=attr.setters.NO_OP
+    )
+
+    @_name2index.default
+    def _(self):
+        return {name: index for index, name in enumerate(self.player_names)}
+
+    @classmethod
+    def empty(cls, size_x: int, size_y: int, player_names: typing.Sequence[PlayerName]) -> "BoardArrays":
+        num_of_players = len(player_names)
+        return cls(
+            kinds=np.zeros((size_y, size_x), dtype=np.int8),
+            values=np.zeros((size_y, size_x), dtype=np.int8),
+            player_ids=np.full((size_y, size_x), -1, dtype=np.int16),
+            player_names=player_names,
+            player_x=np.zeros(num_of_players, dtype=np.int16),
+            player_y=np.zeros(num_of_players, dtype=np.int16),
+            player_health=np.zeros(num_of_players, dtype=np.int32),
+            player_score=np.zeros(num_of_players, dtype=np.int32),
+        )
+
+    @classmethod
+    def from_cells(
+        cls,
+        cells: typing.Sequence[typing.Sequence[typing.Optional[BaseObject]]],
+        players: typing.Optional[typing.Sequence[Player]] = None,
+    ) -> "BoardArrays":
+        """Packs an object grid. Players are indexed in the order they are met row by row,
+        or in the order of players, which may also hold players outside of the grid"""
+        if players is None:
+            players = [cell for row in cells for cell in row if isinstance(cell, Player)]
+        arrays = cls.empty(len(cells[0]), len(cells), [player.name for player in players])
+        for index, player in enumerate(players):
+            arrays.player_x[index] = player.x
+            arrays.player_y[index] = player.y
+            arrays.player_health[index] = player.health
+            arrays.player_score[index] = player.score
+
+        for y, row in enumerate(cells):
+            for x, cell in enumerate(row):
+                if cell is None:
+                    continue
+
+                arrays.kinds[y, x] = cell.kind
+                if isinstance(cell, Bonus):
+                    arrays.values[y, x] = cell.value
+                elif isinstance(cell, Player):
+                    arrays.player_ids[y, x] = arrays.player_index(cell.name)
+
+        return arrays
+
+    def player_index(self, player_name: PlayerName) -> int:
+        return self._name2index[player_name]
+
+    def scalar_views(self) -> _ScalarViews:
+        """Flat views of kinds, values, player_ids, player_x, player_y, player_health and player_score for
+        element-wise access, a cell (x, y) is at y * size_x + x. Made on first use and after an array is rebound
+        """
+        if self._views is None:
+            self._views = _scalar_views(
+                self.kinds,
+                self.values,
+                self.player_ids,
+                self.player_x,
+                self.player_y,
+                self.player_health,
+                self.player_score,
+            )
+        return self._views
+
+    def window(self, x: int, y: int, radius: int) -> "BoardArrays":
+        """Square of side 2 * radius + 1 centered at (x, y), cells outside of the board are walls.
+
+        Grid layers are views when the square fits into the board and small padded copies otherwise.
+        Player columns keep every player, with coordinates relative to the window (they may fall outside it).
+        """
+        side = 2 * radius + 1
+        left, top = x - radius, y - radius
+        size_y, size_x = self.kinds.shape
+        if left >= 0 and top >= 0 and left + side <= size_x and top + side <= size_y:
+            grids = {name: getattr(self, name)[top : top + side, left : left + side] for name in _grid_layers}
+        else:
+            grids = {
+                name: np.full((side, side), fill, dtype=getattr(self, name).dtype)
+                for name, fill in _grid_layers.items()
+            }
+            src_x, src_y = slice(max(left, 0), min(left + side, size_x)), slice(max(top, 0), min(top + side, size_y))
+            dst_x = slice(src_x.start - left, src_x.stop - left)
+            dst_y = slice(src_y.start - top, src_y.stop - top)
+            for name, grid in grids.items():
+                grid[dst_y, dst_x] = getattr(self, name)[src_y, src_x]
+                grid.flags.writeable = self.kinds.flags.writeable
+
+        return BoardArrays(
+            **grids,
+            player_names=self.player_names,
+            player_x=self.player_x - left,
+            player_y=self.player_y - top,
+            player_health=self.player_health,
+            player_score=self.player_score,
+        )
+
+    def _map_arrays(self, func) -> "BoardArrays":
+        return attr.evolve(
+            self,
+            **{
+                field.name: func(getattr(self, field.name))
+                for field in attr.fields(type(self))
+                if isinstance(getattr(self, field.name), np.ndarray)
+            },
+        )
+
+    def copy(self) -> "BoardArrays":
+        return self._map_arrays(np.copy)
+
+    def read_only(self) -> "BoardArrays":
+        """Zero-copy views which raise on writes"""
+        return self._map_arrays(_read_only)
+
+
+# grid layers of BoardArrays and what is outside of the board
+_grid_layers = {"kinds": CellKind.WALL, "values": 0, "player_ids": -1}
+
+
+class _CellRowView:
+    __slots__ = ("_board", "_y")
+
+    def __init__(self, board: "Board", y: int):
+        self._board = board
+        self._y = y
+
+    def __len__(self):
+        return self._board.size_x
+
+    def __getitem__(self, x):
+        if isinstance(x, slice):
+            return [self[i] for i in range(*x.indices(len(self)))]
+
+        return self._board.get_cell(range(self._board.size_x)[x], self._y)
+
+    def __setitem__(self, x, cell):
+        self._board.set_cell(range(self._board.size_x)[x], self._y, cell)
+
+    def __iter__(self):
+        return (self._board.get_cell(x, self._y) for x in range(self._board.size_x))
+
+
+class CellGridView:
+    """Board.cells: the list-of-lists interface on top of Board.get_cell and Board.set_cell.
+
+    Walls are materialized on access, so are the bonuses of an array-backed Board, whose players are PlayerView.
+    """
+
+    __slots__ = ("_board",)
+
+    def __init__(self, board: "Board"):
+        self._board = board
+
+    def __len__(self):
+        return self._board.size_y
+
+    def __getitem__(self, y):
+        if isinstance(y, slice):
+            return [self[i] for i in range(*y.indices(len(self)))]
+
+        return _CellRowView(self._board, range(self._board.size_y)[y])
+
+    def __iter__(self):
+        return (_CellRowView(self._board, y) for y in range(self._board.size_y))
+
+
+SHOOT_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+_shoot_direction2index = {direction: index for index, direction in enumerate(SHOOT_DIRECTIONS)}
+
+
 @attr.s(slots=True, kw_only=True)
+class LineOfSight:
+    """Precomputed shot geometry of a board.
+
+    wall_distance[d, y, x] is the number of steps from (x, y) in SHOOT_DIRECTIONS[d] to the nearest wall
+    (walls never change during a game). rows[y] and columns[x] are sorted x / y coordinates of the players
+    (dead ones too, they still block shots) standing in that row / column, kept up to date by Board.set_cell.
+    """
+
+    wall_distance: npt.NDArray[np.int16] = attr.ib()
+    rows: list[list[int]] = attr.ib()
+    columns: list[list[int]] = attr.ib()
+
+    @classmethod
+    def build(cls, wall_mask: npt.NDArray[np.bool_]) -> "LineOfSight":
+        size_y, size_x = wall_mask.shape
+        wall_distance = np.ones((len(SHOOT_DIRECTIONS), size_y, size_x), dtype=np.int16)
+        for direction, (dx, dy) in enumerate(SHOOT_DIRECTIONS):
+            # walk against the direction, so the neighbour in the direction is already computed
+            distance = wall_distance[direction] if dx else wall_distance[direction].T
+            walls = wall_mask if dx else wall_mask.T
+            step = dx or dy
+            order = range(walls.shape[1] - 2, -1, -1) if step > 0 else range(1, walls.shape[1])
+            for i in order:
+                distance[:, i] = np.where(walls[:, i + step], 1, distance[:, i + step] + 1)
+
+        return cls(
+            wall_distance=wall_distance,
+            rows=[[] for _ in range(size_y)],
+            columns=[[] for _ in range(size_x)],
+        )
+
+    def add_player(self, x: int, y: int):
+        bisect.insort(self.rows[y], x)
+        bisect.insort(self.columns[x], y)
+
+    def remove_player(self, x: int, y: int):
+        self.rows[y].remove(x)
+        self.columns[x].remove(y)
+
+    def move_player(self, x: int, y: int, new_x: int, new_y: int):
+        self.rows[y].remove(x)
+        self.columns[x].remove(y)
+        bisect.insort(self.rows[new_y], new_x)
+        bisect.insort(self.columns[new_x], new_y)
+
+    def place_players(self, xs: typing.Iterable[int], ys: typing.Iterable[int]):
+        """Forgets all players and adds the given ones"""
+        self.rows = [[] for _ in self.rows]
+        self.columns = [[] for _ in self.columns]
+        for x, y in zip(xs, ys):
+            self.add_player(x, y)
+
+    def cast(self, x: int, y: int, dx: int, dy: int) -> tuple[int, int]:
+        """Coordinates of the first wall or player on the way of a shot from (x, y). O(log(players in the line))"""
+        distance = self.wall_distance.item(_shoot_direction2index[dx, dy], y, x)
+        line, coord, step = (self.rows[y], x, dx) if dx else (self.columns[x], y, dy)
+        if step > 0:
+            i = bisect.bisect_right(line, coord)
+            if i < len(line):
+                distance = min(distance, line[i] - coord)
+        else:
+            i = bisect.bisect_left(line, coord)
+            if i > 0:
+                distance = min(distance, coord - line[i - 1])
+
+        return x + dx * distance, y + dy * distance
+
+    def __deepcopy__(self, memo):
+        # a read-only wall_distance belongs to a LevelMap and is shared, the player lines are per board
+        wall_distance = self.wall_distance if not self.wall_distance.flags.writeable else self.wall_distance.copy()
+        return LineOfSight(
+            wall_distance=wall_distance, rows=copy.deepcopy(self.rows, memo), columns=copy.deepcopy(self.columns, memo)
+        )
+
+    def read_only(self) -> "LineOfSight":
+        return LineOfSight(
+            wall_distance=_read_only(self.wall_distance),
+            rows=tuple(map(tuple, self.rows)),
+            columns=tuple(map(tuple, self.columns)),
+        )
+
+
+class _WindowCellRow:
+    __slots__ = ("_cells", "_y", "_left", "_side")
+
+    def __init__(self, cells, y: int, left: int, side: int):
+        self._cells = cells
+        self._y = y
+        self._left = left
+        self._side = side
+
+    def __len__(self):
+        return self._side
+
+    def __getitem__(self, x):
+        if isinstance(x, slice):
+            return [self[i] for i in range(*x.indices(self._side))]
+
+        x = self._left + range(self._side)[x]
+        if 0 <= self._y < len(self._cells) and 0 <= x < len(self._cells[self._y]):
+            return self._cells[self._y][x]
+        return Wall()
+
+    def __iter__(self):
+        return (self[x] for x in range(self._side))
+
+
+class WindowCellGrid:
+    """Square part of a cell grid in window coordinates, cells outside of the board are walls. Nothing is copied"""
+
+    __slots__ = ("_cells", "_left", "_top", "_side")
+
+    def __init__(self, cells, left: int, top: int, side: int):
+        self._cells = cells
+        self._left = left
+        self._top = top
+        self._side = side
+
+    def __len__(self):
+        return self._side
+
+    def __getitem__(self, y):
+        if isinstance(y, slice):
+            return [self[i] for i in range(*y.indices(self._side))]
+
+        return _WindowCellRow(self._cells, self._top + range(self._side)[y], self._left, self._side)
+
+    def __iter__(self):
+        return (self[y] for y in range(self._side))
+
+
+class ReadOnlyStateError(AttributeError):
+    pass
+
+
+def _deny_write(self, *args, **kwargs):
+    raise ReadOnlyStateError(f"{type(self).__name__} is a read-only view of the board")
+
+
+@functools.cache
+def _read_only_class(cls: type) -> type:
+    """Subclass of cls whose instances proxy reads to a wrapped object and refuse every mutation"""
+
+    def __init__(self, target):
+        object.__setattr__(self, "_target", target)
+
+    namespace = {
+        "__slots__": ("_target",),
+        "__init__": __init__,
+        "__setattr__": _deny_write,
+        "__getstate__": lambda self: self._target,
+        "__setstate__": lambda self, target: object.__setattr__(self, "_target", target),
+    }
+    for field in attr.fields(cls):
+        namespace[field.name] = property(lambda self, name=field.name: getattr(self._target, name), _deny_write)
+    for name in ("heal", "damage", "change_score", "move", "reset", "pick"):
+        if hasattr(cls, name):
+            namespace[name] = _deny_write
+
+    return type(f"ReadOnly{cls.__name__}", (cls,), namespace)
+
+
+class _ReadOnlyCellRow:
+    __slots__ = ("_row", "_proxies")
+
+    def __init__(self, row, proxies: dict[int, BaseObject]):
+        self._row = row
+        self._proxies = proxies
+
+    def _proxy(self, cell):
+        if cell is None or isinstance(cell, Wall):
+            return cell
+
+        proxy = self._proxies.get(id(cell))
+        if proxy is None or proxy._target is not cell:
+            proxy = self._proxies[id(cell)] = _read_only_class(type(cell))(cell)
+        return proxy
+
+    def __len__(self):
+        return len(self._row)
+
+    def __getitem__(self, x):
+        if isinstance(x, slice):
+            return [self._proxy(cell) for cell in self._row[x]]
+
+        return self._proxy(self._row[x])
+
+    def __iter__(self):
+        return map(self._proxy, self._row)
+
+
+class ReadOnlyCellGrid:
+    """Read-only view of Board.cells: rows can't be assigned and cells are proxies refusing mutation.
+
+    Nothing is copied, one proxy is created per object and reused for the rest of the turn.
+    """
+
+    __slots__ = ("_cells", "_proxies")
+
+    def __init__(self, cells):
+        self._cells = cells
+        self._proxies = {}
+
+    def __len__(self):
+        return len(self._cells)
+
+    def __getitem__(self, y):
+        if isinstance(y, slice):
+            return [_ReadOnlyCellRow(row, self._proxies) for row in self._cells[y]]
+
+        return _ReadOnlyCellRow(self._cells[y], self._proxies)
+
+    def __iter__(self):
+        return (_ReadOnlyCellRow(row, self._proxies) for row in self._cells)
+
+
+def _deny_frozen_write(instance, attribute, value):
+    """on_setattr hook of State: a read-only state shared by the players of a turn can't be rebound"""
+    if instance._frozen:
+        _deny_write(instance)
+    return value
+
+
+@attr.s(slots=True, kw_only=True, on_setattr=_deny_frozen_write)
 class State:
-    cells: list[list[typing.Optional[BaseObject]]] = attr.ib()
+    cells: list[list[typing.Optional[BaseObject]]] | CellGridView | ReadOnlyCellGrid | WindowCellGrid = attr.ib()
+    _arrays: typing.Optional[BoardArrays] = attr.ib(default=None)
+    line_of_sight: typing.Optional[LineOfSight] = attr.ib(default=None)
+    # items and players of the board, not available in windows
+    objects: typing.Optional["ObjectIndex"] = attr.ib(default=None)
+    # wall-aware distances of the board layout, only on boards with distance_cache_dir
+    distances: typing.Optional[DistanceField] = attr.ib(default=None)
+    # read-only walls of the level map, shared by the boards of the layout, not available in windows
+    walls: typing.Optional[npt.NDArray[np.bool_]] = attr.ib(default=None, repr=False)
+    # board coordinates of cells[0][0], not zero for windows
+    origin: tuple[int, int] = attr.ib(default=(0, 0))
+    # packs the arrays of an object board without visiting every cell, see Board.pack_arrays
+    _pack: typing.Optional[typing.Callable[[], BoardArrays]] = attr.ib(default=None, repr=False, eq=False)
+    # fields of a read-only state can't be assigned, see read_only
+    _frozen: bool = attr.ib(default=False, repr=False, eq=False)
+
+    @property
+    def arrays(self) -> BoardArrays:
+        """Vectorized accessor. Array-backed boards share their own arrays, object boards are packed on demand"""
+        if self._arrays is None:
+            arrays = self._pack() if self._pack is not None else BoardArrays.from_cells(self.cells)
+            if isinstance(self.cells, ReadOnlyCellGrid):
+                arrays = arrays.read_only()
+            # the packed arrays are a cache, so they are stored in a frozen state too
+            object.__setattr__(self, "_arrays", arrays)
+        return self._arrays
+
+    def read_only(self) -> "State":
+        """View of the same board which strategies can't modify, nor rebind its fields. Costs O(1), unlike copy.deepcopy"""
+        return State(
+            cells=ReadOnlyCellGrid(self.cells),
+            arrays=self._arrays.read_only() if self._arrays is not None else None,
+            line_of_sight=self.line_of_sight.read_only() if self.line_of_sight is not None else None,
+            objects=self.objects.read_only() if self.objects is not None else None,
+            distances=self.distances,
+            walls=self.walls,
+            origin=self.origin,
+            pack=self._pack,
+            frozen=True,
+        )
+
+    def window(self, player_name: PlayerName, radius: int) -> "State":
+        """Square of side 2 * radius + 1 centered at the player, see BoardArrays.window.
+
+        Its size doesn't depend on the board size. line_of_sight, objects and distances are not available in windows.
+        """
+        if self._arrays is None and self.objects is not None:
+            return self._object_window(player_name, radius)
+
+        arrays = self.arrays
+        index = arrays.player_index(player_name)
+        x, y = int(arrays.player_x[index]), int(arrays.player_y[index])
+        left, top = x - radius, y - radius
+        return State(
+            cells=WindowCellGrid(self.cells, left, top, 2 * radius + 1),
+            arrays=arrays.window(x, y, radius),
+            origin=(self.origin[0] + left, self.origin[1] + top),
+            frozen=self._frozen,
+        )
+
+    def _object_window(self, player_name: PlayerName, radius: int) -> "State":
+        """Window of an object board, packs only its own cells instead of the whole board"""
+        coords = self.objects.player_coords()
+        x, y = coords[player_name]
+        left, top = x - radius, y - radius
+        side = 2 * radius + 1
+        read_only = isinstance(self.cells, ReadOnlyCellGrid)
+        # packing only reads the cells into new arrays, so the objects behind a read-only view are safe to use
+        cells = self.cells._cells if read_only else self.cells
+        arrays = BoardArrays.from_cells(
+            WindowCellGrid(cells, left, top, side), [cells[py][px] for px, py in coords.values()]
+        )
+        arrays.player_x -= left
+        arrays.player_y -= top
+        return State(
+            cells=WindowCellGrid(self.cells, left, top, side),
+            arrays=arrays.read_only() if read_only else arrays,
+            origin=(self.origin[0] + left, self.origin[1] + top),
+            frozen=self._frozen,
+        )
 
 
 class PlayerNotFoundError(Exception):
     pass
 
 
+class BoardIsFullError(Exception):
+    pass
+
+
+@attr.s(slots=True, kw_only=True, on_setattr=_forget_views)
+class CellSet:
+    """Set of inner cells of a board with O(1) add and remove.
+
+    cells[:count] holds flat ids (y * size_x + x) of the cells in arbitrary order,
+    positions maps a flat id to its place in cells or -1. Only the inner part of the board is indexed
+    (the same cells get_rand_coord can return). count is a 1-element array so that the whole set
+    can be stacked by VectorizedSimulator.
+    """
+
+    size_x: int = attr.ib()
+    size_y: int = attr.ib()
+    cells: npt.NDArray[np.int32] = attr.ib()
+    positions: npt.NDArray[np.int32] = attr.ib()
+    count: npt.NDArray[np.int64] = attr.ib()
+    _views: typing.Optional[_ScalarViews] = attr.ib(
+        default=None, init=False, repr=False, eq=False, on_setattr=attr.setters.NO_OP
+    )
+
+    @classmethod
+    def build(cls, size_x: int, size_y: int, mask: npt.NDArray[np.bool_]) -> "CellSet":
+        inner = np.zeros((size_y, size_x), dtype=np.bool_)
+        inner[1:-1, 1:-1] = True
+        free = np.flatnonzero(mask & inner).astype(np.int32)
+
+        cells = np.zeros(size_x * size_y, dtype=np.int32)
+        cells[: len(free)] = free
+        positions = np.full(size_x * size_y, -1, dtype=np.int32)
+        positions[free] = np.arange(len(free), dtype=np.int32)
+        return cls(size_x=size_x, size_y=size_y, cells=cells, positions=positions, count=np.array([len(free)]))
+
+    @classmethod
+    def empty(cls, size_x: int, size_y: int) -> "CellSet":
+        return cls(
+            size_x=size_x,
+            size_y=size_y,
+            cells=np.zeros(size_x * size_y, dtype=np.int32),
+            positions=np.full(size_x * size_y, -1, dtype=np.int32),
+            count=np.zeros(1, dtype=np.int64),
+        )
+
+    def copy(self) -> "CellSet":
+        return attr.evolve(self, cells=self.cells.copy(), positions=self.positions.copy(), count=self.count.copy())
+
+    def _scalar_views(self) -> _ScalarViews:
+        if self._views is None:
+            self._views = _scalar_views(self.cells, self.positions, self.count)
+        return self._views
+
+    def __len__(self):
+        return self._scalar_views()[2][0]
+
+    def __contains__(self, coord: tuple[int, int]):
+        x, y = coord
+        return self._scalar_views()[1][y * self.size_x + x] >= 0
+
+    def add(self, x: int, y: int):
+        if not (0 < x < self.size_x - 1 and 0 < y < self.size_y - 1):
+            return
+
+        cells, positions, count = self._scalar_views()
+        flat = y * self.size_x + x
+        if positions[flat] >= 0:
+            return
+
+        last = count[0]
+        cells[last] = flat
+        positions[flat] = last
+        count[0] = last + 1
+
+    def remove(self, x: int, y: int):
+        cells, positions, count = self._scalar_views()
+        flat = y * self.size_x + x
+        position = positions[flat]
+        if position < 0:
+            return
+
+        last = count[0] - 1
+        moved = cells[last]
+        cells[position] = moved
+        positions[moved] = position
+        positions[flat] = -1
+        count[0] = last
+
+    def move(self, x: int, y: int, new_x: int, new_y: int):
+        """add(x, y) and then remove(new_x, new_y) in one go, (x, y) takes the place of (new_x, new_y)"""
+        cells, positions, count = self._scalar_views()
+        flat, new_flat = y * self.size_x + x, new_y * self.size_x + new_x
+        position = positions[new_flat]
+        if position < 0 or positions[flat] >= 0 or not (0 < x < self.size_x - 1 and 0 < y < self.size_y - 1):
+            self.add(x, y)
+            self.remove(new_x, new_y)
+            return
+
+        cells[position] = flat
+        positions[flat] = position
+        positions[new_flat] = -1
+
+    def coords(self) -> npt.NDArray[np.intp]:
+        """(count, 2) array of x and y of the cells, in the order of cells"""
+        y, x = np.divmod(self.cells[: len(self)].astype(np.intp), self.size_x)
+        return np.stack([x, y], axis=1)
+
+    def read_only(self) -> "CellSet":
+        return attr.evolve(
+            self, cells=_read_only(self.cells), positions=_read_only(self.positions), count=_read_only(self.count)
+        )
+
+
+@attr.s(slots=True, kw_only=True, on_setattr=_forget_views)
+class FreeCellIndex(CellSet):
+    """Set of empty cells with uniform random choice"""
+
+    def choice(self, rng) -> tuple[int, int]:
+        if not len(self):
+            raise BoardIsFullError("There are no empty cells on the board")
+
+        y, x = divmod(self._scalar_views()[0][rng.randrange(len(self))], self.size_x)
+        return x, y
+
+    def pop_random(self, rng) -> tuple[int, int]:
+        x, y = self.choice(rng)
+        self.remove(x, y)
+        return x, y
+
+
+@attr.s(slots=True, kw_only=True)
+class ObjectIndex:
+    """Cells of the items of every kind and positions of the players, kept up to date by Board.
+
+    Finding objects through it costs O(number of objects) instead of a scan of the whole board.
+    Distances are in moves on an open board: max(|dx|, |dy|), ties go to the first cell in row order.
+    """
+
+    items: dict[CellKind, CellSet] = attr.ib()
+    # the dict of the board itself, only positions are exposed
+    _players: typing.Mapping[PlayerName, Player] = attr.ib()
+
+    @classmethod
+    def empty(cls, size_x: int, size_y: int, players: dict[PlayerName, Player]) -> "ObjectIndex":
+        return cls(items={kind: CellSet.empty(size_x, size_y) for kind in kind2bonus}, players=players)
+
+    def item_coords(self, kinds: typing.Iterable[CellKind] = tuple(kind2bonus)) -> npt.NDArray[np.intp]:
+        """(n, 2) array of x and y of the items of the given kinds"""
+        coords = [self.items[kind].coords() for kind in kinds]
+        return np.concatenate(coords) if coords else np.empty((0, 2), dtype=np.intp)
+
+    def player_coords(self) -> dict[PlayerName, tuple[int, int]]:
+        return {name: (player.x, player.y) for name, player in self._players.items()}
+
+    def players(self) -> typing.Mapping[PlayerName, Player]:
+        """Players by name, read-only ones in a read-only index"""
+        return types.MappingProxyType(self._players)
+
+    @staticmethod
+    def _nearest(coords: npt.NDArray[np.intp], x: int, y: int, k: int) -> npt.NDArray[np.intp]:
+        dist = np.maximum(np.abs(coords[:, 0] - x), np.abs(coords[:, 1] - y))
+        return np.lexsort((coords[:, 0], coords[:, 1], dist))[:k]
+
+    def nearest_items(
+        self, x: int, y: int, k: int = 1, kinds: typing.Iterable[CellKind] = tuple(kind2bonus)
+    ) -> list[tuple[int, int]]:
+        """Up to k cells of items of the given kinds closest to (x, y), the closest first"""
+        coords = self.item_coords(kinds)
+        return [(int(x), int(y)) for x, y in coords[self._nearest(coords, x, y, k)]]
+
+    def nearest_players(
+        self, x: int, y: int, k: int = 1, exclude: typing.Container[PlayerName] = ()
+    ) -> list[PlayerName]:
+        """Names of up to k players closest to (x, y), the closest first. Dead players are on the board too"""
+        names = [name for name in self._players if name not in exclude]
+        coords = np.array([(self._players[name].x, self._players[name].y) for name in names], dtype=np.intp)
+        return [names[index] for index in self._nearest(coords.reshape(-1, 2), x, y, k)]
+
+    def add_item(self, kind: CellKind, x: int, y: int):
+        self.items[kind].add(x, y)
+
+    def remove_item(self, kind: CellKind, x: int, y: int):
+        self.items[kind].remove(x, y)
+
+    def read_only(self) -> "ObjectIndex":
+        players = {name: _read_only_class(type(player))(player) for name, player in self._players.items()}
+        return ObjectIndex(
+            items={kind: cells.read_only() for kind, cells in self.items.items()},
+            players=types.MappingProxyType(players),
+        )
+
+
+@attr.s(slots=True, kw_only=True, frozen=True, eq=False)
+class LevelMap:
+    """Wall layer of a board: walls[y, x] is True for walls. Immutable and shared by all boards of the layout.
+
+    Parsed maps are cached in memory by path (re-read only when the file changes) and by content hash, and
+    optionally in cache_dir as .npy files which are memory-mapped, so worker processes share their pages.
+    The shot geometry and the free cells of the layout are computed once as well, see line_of_sight and free_cells.
+    """
+
+    walls: npt.NDArray[np.bool_] = attr.ib()
+    # content hash of the map file, None for generated layouts
+    key: typing.Optional[str] = attr.ib(default=None)
+    # CellKind of every cell of an empty board of the layout
+    kinds: npt.NDArray[np.int8] = attr.ib(init=False, repr=False)
+    # the same layer as bytes of flat ids, the cheapest scalar lookup for object boards
+    flat_kinds: bytes = attr.ib(init=False, repr=False)
+    _wall_distance: list[npt.NDArray[np.int16]] = attr.ib(factory=list)
+    _free_cells: list["FreeCellIndex"] = attr.ib(factory=list)
+
+    # (path, mtime, size) -> key and key -> map of this process
+    _path2key: typing.ClassVar[dict[tuple[str, int, int], str]] = {}
+    _loaded: typing.ClassVar[dict[str, "LevelMap"]] = {}
+
+    @kinds.default
+    def _(self):
+        return _read_only(np.where(self.walls, CellKind.WALL, CellKind.EMPTY).astype(np.int8))
+
+    @flat_kinds.default
+    def _(self):
+        return self.kinds.tobytes()
+
+    @classmethod
+    def parse(cls, text: str) -> npt.NDArray[np.bool_]:
+        """Lines of "." (empty) and anything else (wall), short lines are padded with walls, empty ones skipped"""
+        rows = [line for line in map(str.rstrip, text.splitlines()) if line]
+        size_x = max(map(len, rows))
+        return np.array([[char != "." for char in row.ljust(size_x, "#")] for row in rows], dtype=np.bool_)
+
+    @classmethod
+    def load(cls, path: str | Path, cache_dir: typing.Optional[str | Path] = None) -> "LevelMap":
+        stat = os.stat(path)
+        path_key = str(Path(path).resolve()), stat.st_mtime_ns, stat.st_size
+        key = cls._path2key.get(path_key)
+        if key is None or key not in cls._loaded:
+            with open(path, "rb") as fin:
+                content = fin.read()
+            key = cls._path2key[path_key] = hashlib.sha256(content).hexdigest()[:32]
+            if key not in cls._loaded:
+                cls._loaded[key] = cls(walls=cls._cached_walls(key, content, cache_dir), key=key)
+
+        return cls._loaded[key]
+
+    @classmethod
+    def _cached_walls(cls, key: str, content: bytes, cache_dir: typing.Optional[str | Path]) -> npt.NDArray[np.bool_]:
+        if cache_dir is None:
+            return _read_only(cls.parse(content.decode()))
+
+        path = Path(cache_dir) / f"{key}.walls.npy"
+        if not path.exists():
+            os.makedirs(cache_dir, exist_ok=True)
+            # written under a temporary name, so a concurrent reader never sees half a file
+            with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False) as fout:
+                np.save(fout, cls.parse(content.decode()))
+            os.replace(fout.name, path)
+        return np.load(path, mmap_mode="r")
+
+    @classmethod
+    @functools.cache
+    def border(cls, size_x: int, size_y: int) -> "LevelMap":
+        """Empty board of the given size with walls on the border"""
+        walls = np.zeros((size_y, size_x), dtype=np.bool_)
+        walls[[0, -1], :] = True
+        walls[:, [0, -1]] = True
+        return cls(walls=_read_only(walls))
+
+    @classmethod
+    def _restore(cls, key: typing.Optional[str], walls: npt.NDArray[np.bool_]) -> "LevelMap":
+        if key is None:
+            return cls.border(walls.shape[1], walls.shape[0])
+        if key not in cls._loaded:
+            cls._loaded[key] = cls(walls=_read_only(walls), key=key)
+        return cls._loaded[key]
+
+    def __reduce__(self):
+        # an unpickled map is the one of its layout in the receiving process
+        return LevelMap._restore, (self.key, np.asarray(self.walls))
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @property
+    def size_x(self) -> int:
+        return self.walls.shape[1]
+
+    @property
+    def size_y(self) -> int:
+        return self.walls.shape[0]
+
+    def free_cells(self) -> FreeCellIndex:
+        """FreeCellIndex of all cells which aren't walls, a copy of the one computed once"""
+        if not self._free_cells:
+            self._free_cells.append(FreeCellIndex.build(self.size_x, self.size_y, ~np.asarray(self.walls)))
+        return self._free_cells[0].copy()
+
+    def line_of_sight(self) -> "LineOfSight":
+        """LineOfSight without players, wall_distance is computed once and shared read-only"""
+        if not self._wall_distance:
+            self._wall_distance.append(_read_only(LineOfSight.build(self.walls).wall_distance))
+        return LineOfSight(
+            wall_distance=self._wall_distance[0],
+            rows=[[] for _ in range(self.size_y)],
+            columns=[[] for _ in range(self.size_x)],
+        )
+
+
 @attr.s(slots=True, kw_only=True)
 class Board:
     size_x: int = attr.ib()
@@ -155,11 +1081,28 @@ class Board:
     available_items: int = attr.ib(default=0)
     max_health: int = attr.ib()
     level_map_path: typing.Optional[str | Path] = attr.ib(default=None)
-
-    cells: list[list[typing.Optional[BaseObject]]] = attr.ib(default=None, init=False)
+    storage: str = attr.ib(default="objects", validator=attr.validators.in_(("objects", "arrays")))
+    # directory of precomputed distance fields, see distances.DistanceField
+    distance_cache_dir: typing.Optional[str | Path] = attr.ib(default=None)
+    # directory of parsed level maps, see LevelMap
+    level_map_cache_dir: typing.Optional[str | Path] = attr.ib(default=None)
+
+    level_map: LevelMap = attr.ib(default=None, init=False)
+    cells: CellGridView = attr.ib(default=None, init=False)
+    # players and items of an object board by flat id, walls are looked up in level_map and never copied
+    _objects_at: dict[int, BaseObject] = attr.ib(factory=dict, init=False)
+    arrays: typing.Optional[BoardArrays] = attr.ib(default=None, init=False)
+    free_cells: FreeCellIndex = attr.ib(default=None, init=False)
+    objects: ObjectIndex = attr.ib(default=None, init=False)
+    line_of_sight: LineOfSight = attr.ib(default=None, init=False)
+    distances: typing.Optional[DistanceField] = attr.ib(default=None, init=False)
     _name2player: dict[PlayerName, Player] = attr.ib(factory=dict, init=False)
+    # the board-is-full warning is logged once per game, not on every step
+    _warned_full: bool = attr.ib(default=False, init=False)
     num_of_players: int = attr.ib(default=None)
     player_names: list[PlayerName] = attr.ib()
+    seed: typing.Optional[int] = attr.ib(default=None)
+    _rng: typing.Optional[random.Random] = attr.ib(init=False)
 
     @player_names.default
     def _(self):
@@ -168,20 +1111,25 @@ class Board:
         ), "Not defined amount_of_players and player_names for Board. You must define anything"
         return list(map(str, range(self.amount_of_players)))
 
+    @_rng.default
+    def _(self):
+        return random.Random(self.seed) if self.seed is not None else None
+
+    @property
+    def rng(self):
+        """Own generator of a seeded board (copied together with the board), the global one otherwise"""
+        return self._rng or random
+
     def __attrs_post_init__(self):
         self.restart()
 
     def get_rand_coord(self):
-        x = random.randint(1, self.size_x - 2)
-        y = random.randint(1, self.size_y - 2)
+        x = self.rng.randint(1, self.size_x - 2)
+        y = self.rng.randint(1, self.size_y - 2)
         return x, y
 
     def get_rand_coord_empty_cell(self):
-        x, y = self.get_rand_coord()
-        while not self.is_empty(x, y):
-            x, y = self.get_rand_coord()
-
-        return x, y
+        return self.free_cells.choice(self.rng)
 
     def get_player(self, player_name: PlayerName, strict=True) -> Player | None:
         player = self._name2player.get(player_name)
@@ -190,98 +1138,340 @@ class Board:
 
         return player
 
-    def _load_level_map(self):
-        self.cells = []
-        with open(self.level_map_path, "r") as file:
-            for line in file:
-                line = line.rstrip()
-                if line:
-                    row = [None if char == "." else Wall() for char in line]
-                    self.cells.append(row)
-
-        self.size_x = max(map(len, self.cells))
-        for row in self.cells:
-            row.extend([Wall()] * (self.size_x - len(row)))
-        self.size_y = len(self.cells)
-
     def _generate_walls(self):
+        self.level_map = None
         if self.level_map_path is not None:
             try:
-                self._load_level_map()
-                return
-            except OSError:
+                self.level_map = LevelMap.load(self.level_map_path, self.level_map_cache_dir)
+            except (OSError, ValueError):
                 logger.exception("Couldn't parse level map :(")
 
-        self.cells = [[None] * self.size_x for _ in range(self.size_y)]
-        self.cells[0] = [Wall()] * self.size_x
-        self.cells[-1] = [Wall()] * self.size_x
-        for i in range(self.size_y):
-            self.cells[i][0] = Wall()
-            self.cells[i][-1] = Wall()
+        if self.level_map is None:
+            self.level_map = LevelMap.border(self.size_x, self.size_y)
+        self.size_x, self.size_y = self.level_map.size_x, self.level_map.size_y
+
+    def _pack_cells(self):
+        self.cells = CellGridView(self)
+        if self.storage != "arrays":
+            self._objects_at.clear()
+            return
+
+        if self.arrays is None or self.arrays.kinds.shape != (self.size_y, self.size_x):
+            self.arrays = BoardArrays.empty(self.size_x, self.size_y, self.player_names)
+            self._name2player.clear()
+
+        self.arrays.kinds[...] = self.level_map.kinds
+        self.arrays.values[...] = 0
+        self.arrays.player_ids[...] = -1
+
+    def _index_free_cells(self):
+        self.free_cells = self.level_map.free_cells()
+
+    def _build_line_of_sight(self):
+        self.line_of_sight = self.level_map.line_of_sight()
+        if self.distance_cache_dir is not None:
+            self.distances = DistanceField.get(self.distance_cache_dir, np.asarray(self.level_map.walls))
+
+    def _create_player(self, name: PlayerName, x: int, y: int) -> Player:
+        if self.arrays is None:
+            return Player(name=name, x=x, y=y, max_health=self.max_health)
+
+        return PlayerView(
+            name=name,
+            x=x,
+            y=y,
+            max_health=self.max_health,
+            arrays=self.arrays,
+            index=self.arrays.player_index(name),
+        )
 
     def _generate_players(self):
         for name in self.player_names:
             x, y = self.get_rand_coord_empty_cell()
-            player = self.get_player(name, strict=False) or Player(name=name, x=x, y=y, max_health=self.max_health)
+            player = self.get_player(name, strict=False)
+            if player is None:
+                player = self._create_player(name, x, y)
+            else:
+                player.x, player.y = x, y
+                player.reset()
             self.set_cell(x, y, player)
             self._name2player[name] = player
 
-    def _generate_items(self, count):
+    def draw_items(self, count) -> list[tuple[int, int, CellKind, int]]:
+        """Chooses cells, kinds and values for up to count spawns.
+
+        The cells leave the free-cell index at once, the caller must place the items.
+        """
+        if count > len(self.free_cells):
+            if not self._warned_full:
+                logger.warning("Board is full: only %s of %s items can be spawned", len(self.free_cells), count)
+                self._warned_full = True
+            count = len(self.free_cells)
+
+        drawn = []
         for i in range(count):
-            x, y = self.get_rand_coord_empty_cell()
-            self.set_cell(x, y, Spawner.spawn())
+            x, y = self.free_cells.pop_random(self.rng)
+            drawn.append((x, y, *Spawner.draw(self.rng)))
+
+        return drawn
 
-        self.available_items += count
+    def _generate_items(self, count):
+        drawn = self.draw_items(count)
+        # the cells were empty and already left the free-cell index
+        if self.arrays is None:
+            for x, y, kind, value in drawn:
+                self._objects_at[y * self.size_x + x] = kind2bonus[kind](value=value)
+                self.objects.add_item(kind, x, y)
+        else:
+            # no objects are made
+            kinds, values = self.arrays.scalar_views()[:2]
+            for x, y, kind, value in drawn:
+                kinds[y * self.size_x + x] = kind
+                values[y * self.size_x + x] = value
+                self.objects.add_item(kind, x, y)
+
+        self.available_items += len(drawn)
 
     def recharge_items(self):
-        self._generate_items(self.num_of_items - self.available_items)
+        if self.available_items < self.num_of_items:
+            self._generate_items(self.num_of_items - self.available_items)
 
     def restart(self):
         self._generate_walls()
+        self._pack_cells()
+        self._index_free_cells()
+        self.objects = ObjectIndex.empty(self.size_x, self.size_y, self._name2player)
+        self._build_line_of_sight()
+        self.available_items = 0
+        self._warned_full = False
         self._generate_players()
         self._generate_items(self.num_of_items)
 
     def get_cell(self, x, y):
-        return self.cells[y][x]
+        if self.arrays is None:
+            flat = y * self.size_x + x
+            cell = self._objects_at.get(flat)
+            if cell is None and self.level_map.flat_kinds[flat] == _WALL:
+                return Wall()
+            return cell
+
+        kinds, values, player_ids = self.arrays.scalar_views()[:3]
+        flat = y * self.size_x + x
+        kind = kinds[flat]
+        if kind == _EMPTY:
+            return None
+        if kind == _WALL:
+            return Wall()
+        if kind == _PLAYER:
+            return self._name2player[self.arrays.player_names[player_ids[flat]]]
+        return kind2bonus[kind](value=values[flat])
+
+    def _kind(self, x, y) -> int:
+        if self.arrays is None:
+            flat = y * self.size_x + x
+            cell = self._objects_at.get(flat)
+            return self.level_map.flat_kinds[flat] if cell is None else cell.kind
+
+        return self.arrays.scalar_views()[0][y * self.size_x + x]
+
+    def get_kind(self, x, y) -> CellKind:
+        return CellKind(self._kind(x, y))
 
     def set_cell(self, x, y, cell):
-        self.cells[y][x] = cell
+        kind = self._kind(x, y)
+        new_kind = _EMPTY if cell is None else cell.kind
+        if new_kind == _EMPTY:
+            self.free_cells.add(x, y)
+        elif kind == _EMPTY:
+            self.free_cells.remove(x, y)
+
+        if kind in _BONUS_KINDS:
+            self.objects.remove_item(kind, x, y)
+        if new_kind in _BONUS_KINDS:
+            self.objects.add_item(new_kind, x, y)
+
+        if kind == _PLAYER:
+            self.line_of_sight.remove_player(x, y)
+        if new_kind == _PLAYER:
+            self.line_of_sight.add_player(x, y)
+
+        if self.arrays is None:
+            # walls of the level map are never replaced, so only players and items are stored
+            if new_kind == _EMPTY:
+                self._objects_at.pop(y * self.size_x + x, None)
+            else:
+                self._objects_at[y * self.size_x + x] = cell
+            return
+
+        kinds, values, player_ids = self.arrays.scalar_views()[:3]
+        flat = y * self.size_x + x
+        kinds[flat] = new_kind
+        values[flat] = cell.value if new_kind in _BONUS_KINDS else 0
+        player_ids[flat] = self.arrays.player_index(cell.name) if new_kind == _PLAYER else -1
 
     def is_empty(self, x, y):
-        return self.get_cell(x, y) is None
+        return self._kind(x, y) == _EMPTY
+
+    def is_player(self, x, y):
+        return self._kind(x, y) == _PLAYER
 
     def can_move_to(self, x, y):
-        return not isinstance(self.get_cell(x, y), (Player, Wall))
+        return self._kind(x, y) not in _BLOCKING_KINDS
+
+    def alive(self) -> list[bool]:
+        """Whether every player is alive, in the order of player_names"""
+        if self.arrays is None:
+            return [self._name2player[name].health > 0 for name in self.player_names]
+
+        return [health > 0 for health in self.arrays.scalar_views()[5]]
+
+    def any_alive(self) -> bool:
+        if self.arrays is None:
+            for player in self._name2player.values():
+                if player.health > 0:
+                    return True
+            return False
+
+        for health in self.arrays.scalar_views()[5]:
+            if health > 0:
+                return True
+        return False
 
     def handle_shoot(self, player_name: PlayerName, dx: int, dy: int):
+        if self.arrays is not None:
+            self._handle_array_shoot(self.get_player(player_name).index, dx, dy)
+            return
+
         player = self.get_player(player_name)
-        x = player.x + dx
-        y = player.y + dy
-        while self.can_move_to(x, y):
-            x += dx
-            y += dy
-
-        cell = self.get_cell(x, y)
-        if isinstance(cell, Player):
-            cell.damage(1)
+        x, y = self.line_of_sight.cast(player.x, player.y, dx, dy)
+        target = self._objects_at.get(y * self.size_x + x)
+        if isinstance(target, Player):
+            target.damage(1)
             player.change_score(1)
 
+    def _handle_array_shoot(self, index: int, dx: int, dy: int):
+        """handle_shoot on the arrays, with the effects of Player.damage and Player.change_score"""
+        player_ids, player_x, player_y, health, score = self.arrays.scalar_views()[2:]
+        x, y = self.line_of_sight.cast(player_x[index], player_y[index], dx, dy)
+        target = player_ids[y * self.size_x + x]
+        if target < 0:
+            return
+
+        if health[target] > 0:
+            health[target] -= 1
+        if health[index] > 0:
+            score[index] += 1
+
     def handle_direct_move(self, player_name: PlayerName, dx: int, dy: int):
+        if self.arrays is not None:
+            self._handle_array_move(self.get_player(player_name).index, dx, dy)
+            return
+
         player = self.get_player(player_name)
-        x = player.x + dx
-        y = player.y + dy
-        if self.can_move_to(x, y):
-            self.set_cell(player.x, player.y, None)
-            player.move(dx, dy)
-            cell = self.get_cell(player.x, player.y)
-            if cell is not None:
-                cell.pick(player)
-                self.available_items -= 1
-            self.set_cell(player.x, player.y, player)
-
-    def get_state_ref(self) -> State:
-        # cut out a square of const radius centered at the player which requested the state
-        return State(cells=self.cells)
+        # a dead player stays where it is
+        if player.health <= 0:
+            return
+
+        x, y = player.x, player.y
+        new_x, new_y = x + dx, y + dy
+        flat = y * self.size_x + x
+        new_flat = flat + dy * self.size_x + dx
+        objects_at = self._objects_at
+        cell = objects_at.get(new_flat)
+        if cell is None:
+            if self.level_map.flat_kinds[new_flat] == _WALL:
+                return
+        elif isinstance(cell, Player):
+            return
+
+        del objects_at[flat]
+        self.line_of_sight.move_player(x, y, new_x, new_y)
+        player.x, player.y = new_x, new_y
+        if cell is None:
+            self.free_cells.move(x, y, new_x, new_y)
+        else:
+            self.free_cells.add(x, y)
+            self.objects.remove_item(cell.kind, new_x, new_y)
+            cell.pick(player)
+            self.available_items -= 1
+        objects_at[new_flat] = player
+
+    def _handle_array_move(self, index: int, dx: int, dy: int):
+        """handle_direct_move on the arrays, a bonus is applied the way its pick would do it"""
+        kinds, values, player_ids, player_x, player_y, health, score = self.arrays.scalar_views()
+        if health[index] <= 0:
+            return
+
+        x, y = player_x[index], player_y[index]
+        flat = y * self.size_x + x
+        new_x, new_y, new_flat = x + dx, y + dy, flat + dy * self.size_x + dx
+        kind = kinds[new_flat]
+        if kind == _WALL or kind == _PLAYER:
+            return
+
+        kinds[flat] = _EMPTY
+        player_ids[flat] = -1
+        self.line_of_sight.move_player(x, y, new_x, new_y)
+        player_x[index], player_y[index] = new_x, new_y
+        if kind == _EMPTY:
+            self.free_cells.move(x, y, new_x, new_y)
+        else:
+            self.free_cells.add(x, y)
+            value = values[new_flat]
+            values[new_flat] = 0
+            self.objects.remove_item(kind, new_x, new_y)
+            if kind == _HEAL_BONUS:
+                health[index] = min(health[index] + value, self.max_health)
+            elif kind == _POISON_BONUS:
+                health[index] = max(health[index] - value, 0)
+            else:
+                score[index] += value
+            self.available_items -= 1
+        kinds[new_flat] = _PLAYER
+        player_ids[new_flat] = index
+
+    def pack_arrays(self) -> BoardArrays:
+        """BoardArrays of the board, new ones for an object board. They are made of the kinds of the level map
+        and the cells of ObjectIndex, so packing costs a copy of the layer and O(items + players) instead of
+        BoardArrays.from_cells, which visits every cell
+        """
+        if self.arrays is not None:
+            return self.arrays
+
+        arrays = BoardArrays.empty(self.size_x, self.size_y, self.player_names)
+        arrays.kinds[...] = self.level_map.kinds
+        kinds, values, player_ids, player_x, player_y, health, score = arrays.scalar_views()
+        for kind, items in self.objects.items.items():
+            for flat in items.cells[: len(items)].tolist():
+                kinds[flat] = kind
+                values[flat] = self._objects_at[flat].value
+
+        for index, name in enumerate(self.player_names):
+            player = self._name2player[name]
+            flat = player.y * self.size_x + player.x
+            kinds[flat] = CellKind.PLAYER
+            player_ids[flat] = index
+            player_x[index], player_y[index] = player.x, player.y
+            health[index], score[index] = player.health, player.score
+        return arrays
+
+    def get_state_ref(
+        self, player_name: typing.Optional[PlayerName] = None, radius: typing.Optional[int] = None
+    ) -> State:
+        """The whole board, or a square of const radius centered at the player which requested the state"""
+        state = State(
+            cells=self.cells,
+            arrays=self.arrays,
+            line_of_sight=self.line_of_sight,
+            objects=self.objects,
+            distances=self.distances,
+            walls=self.level_map.walls,
+            pack=self.pack_arrays if self.arrays is None else None,
+        )
+        if radius is None:
+            return state
+
+        return state.window(player_name, radius)
 
 
 class Spawner:
@@ -296,5 +1486,12 @@ class Spawner:
     )
 
     @classmethod
-    def spawn(cls) -> Item:
-        return random.choices(*cls.items__probs)[0]()
+    def draw(cls, rng=random) -> tuple[CellKind, int]:
+        """Kind and value of a new item, the same draws spawn makes"""
+        item_cls = rng.choices(*cls.items__probs)[0]
+        return item_cls.kind, rng.choices(*item_cls._values__probs)[0]
+
+    @classmethod
+    def spawn(cls, rng=random) -> Item:
+        kind, value = cls.draw(rng)
+        return kind2bonus[kind](value=value)
@@ -0,0 +1,204 @@
+import attr
+import logging
+import multiprocessing
+import multiprocessing.connection
+import numpy as np
+import time
+import typing
+from multiprocessing import shared_memory
+
+from rules import Board, BoardArrays
+from strategies.core import NO_MOVE, BaseMove, BaseStrategy, DirectMove, decode_move, encode_move
+
+__all__ = ("StrategySandbox",)
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_MOVE = DirectMove(dx=0, dy=0)
+
+
+def _array_fields(arrays: BoardArrays) -> list[str]:
+    return [field.name for field in attr.fields(BoardArrays) if isinstance(getattr(arrays, field.name), np.ndarray)]
+
+
+def _bind_shared_arrays(arrays: BoardArrays, buffer) -> dict[str, np.ndarray]:
+    """Views of `buffer` with the layout of `arrays`, one after another"""
+    offset, views = 0, {}
+    for name in _array_fields(arrays):
+        array = getattr(arrays, name)
+        views[name] = np.ndarray(array.shape, array.dtype, buffer=buffer, offset=offset)
+        offset += array.nbytes
+    return views
+
+
+def _shared_size(arrays: BoardArrays) -> int:
+    return sum(getattr(arrays, name).nbytes for name in _array_fields(arrays))
+
+
+def _worker_main(connection: multiprocessing.connection.Connection):
+    """Loop of a worker process: ("game", board, shm_name, strategy, readonly_state) starts a game,
+    ("move",) asks for the move code on the board in shared memory, None stops the worker.
+    """
+    shm = board = strategy = None
+    readonly_state = True
+    while (message := connection.recv()) is not None:
+        if message[0] == "game":
+            _, board, shm_name, strategy, readonly_state = message
+            if shm is None or shm.name != shm_name:
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=shm_name)
+
+            # read-only buffer: a strategy can't change the board other workers read
+            for name, view in _bind_shared_arrays(board.arrays, shm.buf.toreadonly()).items():
+                setattr(board.arrays, name, view)
+            # only the arrays are shared, the object index of the copy would go stale
+            board.objects = None
+            continue
+
+        arrays = board.arrays
+        board.line_of_sight.place_players(arrays.player_x.tolist(), arrays.player_y.tolist())
+        state = board.get_state_ref()
+        if readonly_state:
+            state = state.read_only()
+
+        try:
+            code = encode_move(strategy.get_next_move(state))
+        except Exception:
+            logger.exception("Error in get_next_move of %s", strategy.player_name)
+            code = NO_MOVE
+        connection.send(code)
+
+    if shm is not None:
+        shm.close()
+
+
+@attr.s(slots=True, kw_only=True)
+class _Worker:
+    process: multiprocessing.Process = attr.ib()
+    connection: multiprocessing.connection.Connection = attr.ib()
+
+    @classmethod
+    def start(cls) -> "_Worker":
+        connection, worker_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_worker_main, args=(worker_connection,), daemon=True)
+        process.start()
+        worker_connection.close()
+        return cls(process=process, connection=connection)
+
+    def stop(self, timeout: float = 1.0):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+@attr.s(slots=True, kw_only=True)
+class StrategySandbox:
+    """Runs every strategy of a game in its own worker process.
+
+    The board is copied to shared memory once per turn, so a worker gets only a short message per move.
+    A move has `deadline` seconds: a strategy which doesn't answer in time, raises or returns something
+    which isn't a move plays FALLBACK_MOVE. A late worker is killed and replaced, its strategy starts from
+    a fresh copy at the next turn, so the step latency stays bounded by the deadline.
+    Workers are reused across games, a sandbox plays one game at a time. Needs boards with storage="arrays".
+    """
+
+    deadline: float = attr.ib(default=0.1)
+    _workers: list[_Worker] = attr.ib(factory=list, init=False)
+    _shm: typing.Optional[shared_memory.SharedMemory] = attr.ib(default=None, init=False)
+    _shared: dict[str, np.ndarray] = attr.ib(factory=dict, init=False)
+    _board: typing.Optional[Board] = attr.ib(default=None, init=False)
+    _strategies: list[BaseStrategy] = attr.ib(factory=list, init=False)
+    _readonly_state: bool = attr.ib(default=True, init=False)
+    # workers which have to get their game again
+    _stale: set[int] = attr.ib(factory=set, init=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for worker in self._workers:
+            worker.stop()
+        self._workers.clear()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+        self._board = None
+
+    def start_game(self, board: Board, strategies: list[BaseStrategy], readonly_state: bool = True):
+        """Sends the board layout and the strategies to the workers, one worker per strategy"""
+        if board.arrays is None:
+            raise ValueError("StrategySandbox needs boards with storage='arrays'")
+
+        size = _shared_size(board.arrays)
+        if self._shm is None or self._shm.size < size:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+
+        self._shared = _bind_shared_arrays(board.arrays, self._shm.buf)
+        self._board = board
+        self._strategies = list(strategies)
+        self._readonly_state = readonly_state
+        while len(self._workers) < len(strategies):
+            self._workers.append(_Worker.start())
+        self._stale = set(range(len(strategies)))
+
+    def _send_game(self, index: int):
+        self._workers[index].connection.send(
+            ("game", self._board, self._shm.name, self._strategies[index], self._readonly_state)
+        )
+        self._stale.discard(index)
+
+    def get_next_moves(self, board: Board, strategies: list[BaseStrategy]) -> list[BaseMove]:
+        """Moves of the strategies of the current game in the same order, see the class docs for the fallback"""
+        for name, view in self._shared.items():
+            np.copyto(view, getattr(board.arrays, name))
+
+        strategy_id2index = {id(strategy): index for index, strategy in enumerate(self._strategies)}
+        connection2index = {}
+        for strategy in strategies:
+            index = strategy_id2index[id(strategy)]
+            if index in self._stale:
+                self._send_game(index)
+            self._workers[index].connection.send(("move",))
+            connection2index[self._workers[index].connection] = index
+
+        index2code, failed = {}, []
+        deadline = time.perf_counter() + self.deadline
+        while connection2index and (timeout := deadline - time.perf_counter()) > 0:
+            for connection in multiprocessing.connection.wait(list(connection2index), timeout):
+                index = connection2index.pop(connection)
+                try:
+                    index2code[index] = connection.recv()
+                except EOFError:
+                    logger.warning("Worker of %s died, it is restarted", self._strategies[index].player_name)
+                    failed.append(index)
+
+        for index in connection2index.values():
+            logger.warning("%s missed the deadline, worker is restarted", self._strategies[index].player_name)
+            failed.append(index)
+
+        for index in failed:
+            self._workers[index].kill()
+            self._workers[index] = _Worker.start()
+            self._stale.add(index)
+
+        moves = [decode_move(index2code.get(strategy_id2index[id(strategy)], NO_MOVE)) for strategy in strategies]
+        return [move if move is not None else FALLBACK_MOVE for move in moves]
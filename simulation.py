@@ -1,13 +1,37 @@
 import attr
 import collections
+import concurrent.futures
 import copy
+import functools
+import itertools
+import json
 import logging
+import numpy as np
+import numpy.typing as npt
+import time
+import typing
 
-from rules import Board, Player, PlayerName
-from strategies.core import BaseStrategy, BaseMove, Shoot, DirectMove
+from profiling import Profiler
+from sandbox import StrategySandbox
+from rules import SHOOT_DIRECTIONS, Board, BoardArrays, CellKind, FreeCellIndex, Player, PlayerName, State, kind2bonus
+from strategies.core import NO_MOVE, BaseStrategy, BaseMove, Shoot, DirectMove, decode_move, encode_move
 
 logger = logging.getLogger(__name__)
 
+# (dx + 1, dy + 1) -> index of the direction in SHOOT_DIRECTIONS
+_shoot_direction_index = np.full((3, 3), -1, dtype=np.intp)
+_shoot_direction_index[tuple(np.array(SHOOT_DIRECTIONS).T + 1)] = np.arange(len(SHOOT_DIRECTIONS))
+
+# move code (see strategies.core.encode_move) -> dx, dy and kind of the move, NO_MOVE is neither kind
+_code_dx = np.zeros(NO_MOVE + 1, dtype=np.intp)
+_code_dy = np.zeros(NO_MOVE + 1, dtype=np.intp)
+_code_is_shoot = np.zeros(NO_MOVE + 1, dtype=np.bool_)
+_code_is_direct_move = np.zeros(NO_MOVE + 1, dtype=np.bool_)
+for _code, _move in enumerate(BaseStrategy._possible_moves):
+    _code_dx[_code], _code_dy[_code] = _move.dx, _move.dy
+    _code_is_shoot[_code] = isinstance(_move, Shoot)
+    _code_is_direct_move[_code] = isinstance(_move, DirectMove)
+
 
 @attr.s(slots=True, kw_only=True)
 class TurnDescription:
@@ -15,14 +39,243 @@ class TurnDescription:
     direct_moves: list[tuple[PlayerName, DirectMove]] = attr.ib()
 
 
+class HistoryStream:
+    """Append-only file of a SimulationHistory, written while the game runs.
+
+    Format: MAGIC, a JSON header line with board_config and player_names, then one row of
+    len(player_names) bytes per step. A row is flushed as soon as it is recorded, so a crash loses
+    at most the step being written, and a truncated last row is dropped on reading.
+    """
+
+    MAGIC = b"EAGHIST1\n"
+
+    def __init__(self, path: str, header: dict, rows: npt.NDArray[np.uint8]):
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(self.MAGIC)
+        self._file.write(json.dumps(header, default=str).encode() + b"\n")
+        self._file.write(rows.tobytes())
+        self._file.flush()
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        # an unpickled stream keeps appending to the same file
+        self.path = state["path"]
+        self._file = open(self.path, "ab")
+
+    def write(self, row: npt.NDArray[np.uint8]):
+        self._file.write(row.tobytes())
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    @classmethod
+    def read(cls, path: str) -> tuple[dict, npt.NDArray[np.uint8]]:
+        with open(path, "rb") as fin:
+            if fin.readline() != cls.MAGIC:
+                raise ValueError(f"{path} is not a simulation history stream")
+            header = json.loads(fin.readline())
+            data = np.frombuffer(fin.read(), dtype=np.uint8)
+
+        width = len(header["player_names"])
+        return header, data[: len(data) // width * width].reshape(-1, width)
+
+
 @attr.s(slots=True, kw_only=True)
 class SimulationHistory:
-    initial_board: Board = attr.ib(default=None)
-    log: list[TurnDescription] = attr.ib(factory=list)
+    """Moves of a game: strategies.core.encode_move of every player (NO_MOVE if it didn't move) per step.
+
+    The initial board isn't stored, Board(**board_config) rebuilds it from the seed and level_map_path there,
+    and replaying the same moves on it draws the same items.
+    Modes: "full" keeps every step, "ring" only the last `capacity` steps and "none" nothing,
+    the last two are for training where the log is never read.
+    """
+
+    board_config: typing.Optional[dict] = attr.ib(default=None)
+    player_names: typing.Optional[tuple[PlayerName, ...]] = attr.ib(default=None)
+    mode: str = attr.ib(default="full", validator=attr.validators.in_(("full", "ring", "none")))
+    capacity: int = attr.ib(default=1024)
+    # every recorded step is appended to this file at once, see HistoryStream
+    stream_path: typing.Optional[str] = attr.ib(default=None)
+    moves: npt.NDArray[np.uint8] = attr.ib(default=None, repr=False)
+    num_of_steps: int = attr.ib(default=0)
+    _stream: typing.Optional[HistoryStream] = attr.ib(default=None, init=False, eq=False, repr=False)
+
+    @classmethod
+    def read_stream(cls, path: str, **kwargs) -> "SimulationHistory":
+        header, moves = HistoryStream.read(path)
+        return cls(
+            board_config=header["board_config"],
+            player_names=tuple(header["player_names"]),
+            moves=moves.copy(),
+            num_of_steps=len(moves),
+            **kwargs,
+        )
+
+    def begin(self, player_names: list[PlayerName]):
+        """Called by Simulator before the game, opens the stream"""
+        if self.player_names is None:
+            self.player_names = tuple(player_names)
+        elif self.player_names != tuple(player_names):
+            raise ValueError(f"History of players {self.player_names} can't be played by {tuple(player_names)}")
+
+        if self.moves is None:
+            num_of_rows = self.capacity if self.mode != "none" else 0
+            self.moves = np.full((num_of_rows, len(self.player_names)), NO_MOVE, dtype=np.uint8)
+
+        if self.stream_path is not None and self._stream is None:
+            header = {"board_config": self.board_config, "player_names": self.player_names}
+            self._stream = HistoryStream(self.stream_path, header, self.moves[: self._num_of_rows()])
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def _num_of_rows(self) -> int:
+        return {"full": self.num_of_steps, "ring": min(self.num_of_steps, len(self.moves)), "none": 0}[self.mode]
+
+    @property
+    def discards_moves(self) -> bool:
+        """Nothing keeps the recorded rows, so Simulator doesn't encode them and records None"""
+        return self.mode == "none" and self.stream_path is None
+
+    def record(self, row: typing.Optional[npt.NDArray[np.uint8]]):
+        if row is None:
+            self.num_of_steps += 1
+            return
+
+        if self.mode == "full":
+            if self.num_of_steps == len(self.moves):
+                grow = np.full((max(len(self.moves), self.capacity), self.moves.shape[1]), NO_MOVE, dtype=np.uint8)
+                self.moves = np.concatenate([self.moves, grow])
+            self.moves[self.num_of_steps] = row
+        elif self.mode == "ring":
+            self.moves[self.num_of_steps % len(self.moves)] = row
+
+        self.num_of_steps += 1
+        if self._stream is not None:
+            self._stream.write(row)
+
+    def get_step(self, index) -> typing.Optional[npt.NDArray[np.uint8]]:
+        if self.mode == "none" or not (self.num_of_steps - self._num_of_rows() <= index < self.num_of_steps):
+            return None
+
+        return self.moves[index % len(self.moves)]
+
+
+@functools.cache
+def thread_pool(num_threads: int) -> concurrent.futures.ThreadPoolExecutor:
+    """Shared by all simulators with the same num_query_threads"""
+    return concurrent.futures.ThreadPoolExecutor(num_threads, thread_name_prefix="query_strategies")
+
+
+def _timed_get_next_moves(cls: type[BaseStrategy], strategies: list[BaseStrategy], states: list[State]):
+    start = time.perf_counter()
+    moves = cls.get_next_moves(strategies, states)
+    return moves, time.perf_counter() - start
+
+
+@functools.lru_cache(maxsize=256)
+def _group_by_class(classes: tuple[type[BaseStrategy], ...]) -> dict[type[BaseStrategy], list[int]]:
+    """Indexes of the requests of every class. The players of a game don't change, so the grouping of
+    a turn is almost always the one of the previous turn"""
+    cls2indexes = collections.defaultdict(list)
+    for index, cls in enumerate(classes):
+        cls2indexes[cls].append(index)
+    return dict(cls2indexes)
+
 
-    def get_step(self, index):
-        if index < len(self.log):
-            return self.log[index]
+def query_strategies(
+    requests: list[tuple[BaseStrategy, State]],
+    profiler: typing.Optional[Profiler] = None,
+    num_threads: int = 0,
+) -> list[BaseMove]:
+    """Moves for (strategy, state) pairs in the same order.
+
+    Strategies are grouped by class and every class decides for its whole group with one
+    BaseStrategy.get_next_moves call, so batched strategies see all requests at once, even from different games.
+    The profiler gets the time of every class call split evenly between its moves.
+    With num_threads the calls run concurrently on a thread pool, see _query_strategies_concurrently.
+    """
+    strategies = [strategy for strategy, _ in requests]
+    cls2indexes = _group_by_class(tuple(map(type, strategies)))
+    if num_threads:
+        return _query_strategies_concurrently(requests, cls2indexes, profiler, num_threads)
+
+    if len(cls2indexes) == 1 and profiler is None:
+        # a single class decides for the requests in their order
+        return _get_next_moves(next(iter(cls2indexes)), strategies, [state for _, state in requests])
+
+    moves = [None] * len(requests)
+    for cls, indexes in cls2indexes.items():
+        cls_strategies, cls_states = [strategies[i] for i in indexes], [requests[i][1] for i in indexes]
+        try:
+            if profiler is None:
+                cls_moves = cls.get_next_moves(cls_strategies, cls_states)
+            else:
+                with profiler.strategy(cls.__name__, len(indexes)):
+                    cls_moves = cls.get_next_moves(cls_strategies, cls_states)
+        except Exception:
+            logger.exception("Error in get_next_move")
+            raise
+
+        for index, move in zip(indexes, cls_moves):
+            moves[index] = move
+
+    return moves
+
+
+def _get_next_moves(cls: type[BaseStrategy], strategies: list[BaseStrategy], states: list[State]) -> list[BaseMove]:
+    try:
+        return cls.get_next_moves(strategies, states)
+    except Exception:
+        logger.exception("Error in get_next_move")
+        raise
+
+
+def _query_strategies_concurrently(
+    requests: list[tuple[BaseStrategy, State]],
+    cls2indexes: dict[type[BaseStrategy], list[int]],
+    profiler: typing.Optional[Profiler],
+    num_threads: int,
+) -> list[BaseMove]:
+    """Every class splits its batch into tasks with BaseStrategy.split_batch, the tasks run on the thread pool.
+
+    Results are collected in the order of requests no matter which task finishes first, so turns are the same
+    as without threads as long as strategies don't share a random generator. RandomStrategy draws from the
+    global one, so its moves depend on the order the threads run in.
+    """
+    tasks = []
+    for cls, indexes in cls2indexes.items():
+        groups = cls.split_batch([requests[i][0] for i in indexes], num_threads)
+        tasks.extend((cls, [indexes[i] for i in group]) for group in groups)
+
+    executor = thread_pool(num_threads)
+    futures = [
+        executor.submit(
+            _timed_get_next_moves, cls, [requests[i][0] for i in indexes], [requests[i][1] for i in indexes]
+        )
+        for cls, indexes in tasks
+    ]
+
+    moves = [None] * len(requests)
+    for (cls, indexes), future in zip(tasks, futures):
+        try:
+            cls_moves, elapsed = future.result()
+        except Exception:
+            logger.exception("Error in get_next_move")
+            raise
+
+        if profiler is not None:
+            profiler.add(profiler.strategies, cls.__name__, elapsed, len(indexes))
+        for index, move in zip(indexes, cls_moves):
+            moves[index] = move
+
+    return moves
 
 
 @attr.s(slots=True, kw_only=True)
@@ -34,54 +287,120 @@ class Simulator:
     cur_step: int = attr.ib(default=0, init=False)
     simulation_hist: SimulationHistory = attr.ib(factory=SimulationHistory)
     readonly_state: bool = attr.ib()
+    _player_indexes: dict[PlayerName, int] = attr.ib(init=False)
+    # a copy of the board is kept every snapshot_every steps, so seek replays only the steps after the nearest one
+    snapshot_every: typing.Optional[int] = attr.ib(default=None)
+    snapshots: dict[int, Board] = attr.ib(factory=dict, init=False, repr=False)
+    profiler: typing.Optional[Profiler] = attr.ib(default=None)
+    # strategies run in worker processes with a deadline per move, see StrategySandbox
+    sandbox: typing.Optional[StrategySandbox] = attr.ib(default=None)
+    # ask all players at once on a thread pool of this size, 0 asks them one by one
+    num_query_threads: int = attr.ib(default=0)
+    # the class of all strategies if they share one, then a turn is a single get_next_moves call
+    _strategy_class: typing.Optional[type[BaseStrategy]] = attr.ib(init=False)
 
     @players.default
     def _(self):
         return [self.board.get_player(pname) for pname in self.board.player_names]
 
+    @_player_indexes.default
+    def _(self):
+        return {player_name: index for index, player_name in enumerate(self.board.player_names)}
+
+    @_strategy_class.default
+    def _(self):
+        classes = set(map(type, self.strategies))
+        return classes.pop() if len(classes) == 1 else None
+
+    def __attrs_post_init__(self):
+        self.simulation_hist.begin(self.board.player_names)
+        self.take_snapshot()
+        if self.sandbox is not None:
+            self.sandbox.start_game(self.board, self.strategies, self.readonly_state)
+
     @property
     def is_endgame(self):
-        return not (self.cur_step < self.num_of_steps and any(map(lambda p: p.is_alive, self.players)))
+        return self.cur_step >= self.num_of_steps or not self.board.any_alive()
 
-    def generate_moves(self) -> TurnDescription:
+    def start_turn(self) -> typing.Optional[TurnDescription]:
+        """Advances cur_step. Returns the turn from the history if it is already recorded there"""
         assert not self.is_endgame
 
-        turn_desc = self.simulation_hist.get_step(self.cur_step)
+        row = self.simulation_hist.get_step(self.cur_step)
         self.cur_step += 1
-        if turn_desc is not None:
-            return turn_desc
+        return self.decode_turn(row) if row is not None else None
 
-        frozen_state = self.board.get_state_ref()
-        move_kind2player__move = collections.defaultdict(list)
-        for player, strategy in zip(self.players, self.strategies):
-            if not player.is_alive:
-                continue
+    def decode_turn(self, row: npt.NDArray[np.uint8]) -> TurnDescription:
+        turn_desc = TurnDescription(shoots=[], direct_moves=[])
+        for player_name, code in zip(self.board.player_names, row.tolist()):
+            move = decode_move(code)
+            if isinstance(move, Shoot):
+                turn_desc.shoots.append((player_name, move))
+            elif isinstance(move, DirectMove):
+                turn_desc.direct_moves.append((player_name, move))
 
-            state = copy.deepcopy(frozen_state) if self.readonly_state else frozen_state
-            try:
-                move = strategy.get_next_move(state)
-            except Exception:
-                logger.exception("Error in get_next_move")
-                raise
-                continue
+        return turn_desc
 
-            if not isinstance(move, BaseMove):
-                logger.warning("Incorrect move %s", type(move))
-                continue
+    def get_requests(self) -> list[tuple[Player, BaseStrategy, State]]:
+        """Alive players with their strategies and the state they have to decide on"""
+        players, strategies, state = self._alive_requests()
+        return [(player, strategy, state) for player, strategy in zip(players, strategies)]
 
-            move_kind2player__move[type(move)].append((player.name, move))
+    def _alive_requests(self) -> tuple[list[Player], list[BaseStrategy], State]:
+        """get_requests by columns, all players decide on the same state"""
+        state = self.board.get_state_ref()
+        if self.readonly_state:
+            state = state.read_only()
 
-        turn_desc = TurnDescription(
-            shoots=move_kind2player__move.pop(Shoot, []),
-            direct_moves=move_kind2player__move.pop(DirectMove, []),
-        )
-        self.simulation_hist.log.append(turn_desc)
+        alive = self.board.alive()
+        return list(itertools.compress(self.players, alive)), list(itertools.compress(self.strategies, alive)), state
+
+    def record_turn(self, players: list[Player], moves: list[BaseMove]) -> TurnDescription:
+        shoots, direct_moves, unexpected = [], [], None
+        for player, move in zip(players, moves):
+            move_kind = type(move)
+            if move_kind is Shoot:
+                shoots.append((player.name, move))
+            elif move_kind is DirectMove:
+                direct_moves.append((player.name, move))
+            elif isinstance(move, BaseMove):
+                unexpected = unexpected or collections.defaultdict(list)
+                unexpected[move_kind].append((player.name, move))
+            else:
+                logger.warning("Incorrect move %s", move_kind)
+        turn_desc = TurnDescription(shoots=shoots, direct_moves=direct_moves)
 
-        if move_kind2player__move:
-            logger.warning("Unexpected move kinds: %s", move_kind2player__move)
+        if self.simulation_hist.discards_moves:
+            self.simulation_hist.record(None)
+        else:
+            row = np.full(len(self._player_indexes), NO_MOVE, dtype=np.uint8)
+            for player, move in zip(players, moves):
+                row[self._player_indexes[player.name]] = encode_move(move)
+            self.simulation_hist.record(row)
+
+        if unexpected:
+            logger.warning("Unexpected move kinds: %s", dict(unexpected))
 
         return turn_desc
 
+    def generate_moves(self) -> TurnDescription:
+        turn_desc = self.start_turn()
+        if turn_desc is not None:
+            return turn_desc
+
+        players, strategies, state = self._alive_requests()
+        if self.sandbox is not None:
+            moves = self.sandbox.get_next_moves(self.board, strategies)
+        elif self._strategy_class is not None and self.profiler is None and not self.num_query_threads:
+            moves = _get_next_moves(self._strategy_class, strategies, [state] * len(strategies))
+        else:
+            moves = query_strategies(
+                [(strategy, state) for strategy in strategies],
+                self.profiler,
+                self.num_query_threads,
+            )
+        return self.record_turn(players, moves)
+
     def handle_shoots(self, shoots: list[tuple[PlayerName, Shoot]]):
         for player_name, move in shoots:
             self.board.handle_shoot(player_name, move.dx, move.dy)
@@ -94,8 +413,369 @@ class Simulator:
         self.board.recharge_items()
 
     def step(self):
+        if self.profiler is not None:
+            return self._profiled_step()
+
         turn_desc = self.generate_moves()
         self.handle_shoots(turn_desc.shoots)
         self.handle_direct_moves(turn_desc.direct_moves)
         self.finish_step()
+        self.take_snapshot()
+        return turn_desc
+
+    def _profiled_step(self):
+        with self.profiler.phase("generate_moves"):
+            turn_desc = self.generate_moves()
+        with self.profiler.phase("handle_shoots"):
+            self.handle_shoots(turn_desc.shoots)
+        with self.profiler.phase("handle_direct_moves"):
+            self.handle_direct_moves(turn_desc.direct_moves)
+        with self.profiler.phase("finish_step"):
+            self.finish_step()
+        with self.profiler.phase("take_snapshot"):
+            self.take_snapshot()
         return turn_desc
+
+    def take_snapshot(self):
+        if self.snapshot_every and self.cur_step % self.snapshot_every == 0 and self.cur_step not in self.snapshots:
+            self.snapshots[self.cur_step] = copy.deepcopy(self.board)
+
+    def seek(self, step: int):
+        """Moves the game to the state after `step` steps.
+
+        Restores the nearest snapshot at or before `step` unless the current state is closer, then replays
+        the steps recorded in the history. Steps beyond the history are played as usual. `board` and `players`
+        are new objects after a restore.
+        """
+        start = max((snapshot_step for snapshot_step in self.snapshots if snapshot_step <= step), default=None)
+        if step < self.cur_step or start is not None and start > self.cur_step:
+            if start is None:
+                raise ValueError(f"No snapshot to go back to step {step}, set snapshot_every")
+            if self.simulation_hist.get_step(start) is None and start < min(step, self.simulation_hist.num_of_steps):
+                raise ValueError(f"Steps after {start} are not kept in the history")
+
+            self.board = copy.deepcopy(self.snapshots[start])
+            self.players = [self.board.get_player(player_name) for player_name in self.board.player_names]
+            self.cur_step = start
+            if self.sandbox is not None:
+                self.sandbox.start_game(self.board, self.strategies, self.readonly_state)
+
+        while self.cur_step < step and not self.is_endgame:
+            self.step()
+
+
+@attr.s(slots=True, kw_only=True)
+class VectorizedSimulator:
+    """Advances N independent games in lockstep.
+
+    All boards must use storage="arrays" and have the same size and number of players. Their BoardArrays are
+    rebound to views into stacked arrays (the leading axis is the game), so every board stays a usable Board for
+    strategies and interfaces. Strategies of all games are queried together, then the moves of the step are a
+    (games, players) array of move codes and shoots, direct moves, pickups and item bookkeeping are resolved
+    for the whole batch with NumPy operations. Moves are applied player by player in the order of player_names,
+    so the result is the same as Simulator.step gives. Items are still drawn per board with its own generator.
+    """
+
+    boards: list[Board] = attr.ib()
+    strategies: list[list[BaseStrategy]] = attr.ib()
+    num_of_steps: int = attr.ib()
+    readonly_state: bool = attr.ib()
+    simulation_hists: list[SimulationHistory] = attr.ib()
+    simulators: list[Simulator] = attr.ib(init=False)
+    arrays: BoardArrays = attr.ib(init=False)
+    free_cells: FreeCellIndex = attr.ib(init=False)
+    wall_distance: npt.NDArray[np.int16] = attr.ib(init=False)
+    max_health: npt.NDArray[np.int32] = attr.ib(init=False)
+    num_of_items: npt.NDArray[np.intp] = attr.ib(init=False)
+    # Board.available_items and Simulator.cur_step of every game, written back to the boards and simulators
+    available_items: npt.NDArray[np.intp] = attr.ib(init=False)
+    cur_steps: npt.NDArray[np.intp] = attr.ib(init=False)
+    profiler: typing.Optional[Profiler] = attr.ib(default=None)
+    num_query_threads: int = attr.ib(default=0)
+
+    @simulation_hists.default
+    def _(self):
+        return [SimulationHistory() for _ in self.boards]
+
+    @simulators.default
+    def _(self):
+        return [
+            Simulator(
+                board=board,
+                strategies=strategies,
+                num_of_steps=self.num_of_steps,
+                simulation_hist=simulation_hist,
+                readonly_state=self.readonly_state,
+            )
+            for board, strategies, simulation_hist in zip(self.boards, self.strategies, self.simulation_hists)
+        ]
+
+    @max_health.default
+    def _(self):
+        return np.array([board.max_health for board in self.boards], dtype=np.int32)
+
+    @num_of_items.default
+    def _(self):
+        return np.array([board.num_of_items for board in self.boards], dtype=np.intp)
+
+    @available_items.default
+    def _(self):
+        return np.array([board.available_items for board in self.boards], dtype=np.intp)
+
+    @cur_steps.default
+    def _(self):
+        return np.array([simulator.cur_step for simulator in self.simulators], dtype=np.intp)
+
+    def __attrs_post_init__(self):
+        if any(board.arrays is None for board in self.boards):
+            raise ValueError("VectorizedSimulator needs boards with storage='arrays'")
+
+        first = self.boards[0].arrays
+        for board in self.boards:
+            if board.arrays.kinds.shape != first.kinds.shape or len(board.player_names) != len(first.player_names):
+                raise ValueError("Boards of VectorizedSimulator must have the same size and number of players")
+
+        stacked = {
+            field.name: np.stack([getattr(board.arrays, field.name) for board in self.boards])
+            for field in attr.fields(BoardArrays)
+            if isinstance(getattr(first, field.name), np.ndarray)
+        }
+        self.arrays = BoardArrays(player_names=first.player_names, **stacked)
+        for game, board in enumerate(self.boards):
+            for name, array in stacked.items():
+                setattr(board.arrays, name, array[game])
+
+        self.wall_distance = np.stack([board.line_of_sight.wall_distance for board in self.boards])
+
+        size_y, size_x = first.kinds.shape
+        self.free_cells = FreeCellIndex(
+            size_x=size_x,
+            size_y=size_y,
+            cells=np.stack([board.free_cells.cells for board in self.boards]),
+            positions=np.stack([board.free_cells.positions for board in self.boards]),
+            count=np.stack([board.free_cells.count for board in self.boards]),
+        )
+        for game, board in enumerate(self.boards):
+            board.free_cells.cells = self.free_cells.cells[game]
+            board.free_cells.positions = self.free_cells.positions[game]
+            board.free_cells.count = self.free_cells.count[game]
+
+    @property
+    def cur_step(self):
+        return int(self.cur_steps.max())
+
+    @property
+    def active(self) -> npt.NDArray[np.bool_]:
+        """Games which aren't over, the same as not Simulator.is_endgame"""
+        return (self.cur_steps < self.num_of_steps) & (self.arrays.player_health > 0).any(axis=1)
+
+    @property
+    def is_endgame(self):
+        return not self.active.any()
+
+    def generate_moves(self) -> npt.NDArray[np.uint8]:
+        """Move codes of every player of every game, NO_MOVE for dead players and games which are over.
+
+        Steps kept in the histories are replayed, strategies of the other games are queried together,
+        see query_strategies.
+        """
+        codes = np.full(self.arrays.player_health.shape, NO_MOVE, dtype=np.uint8)
+        games = np.flatnonzero(self.active)
+        queried = np.zeros(len(self.boards), dtype=np.bool_)
+        states = {}
+        for game in games.tolist():
+            simulator = self.simulators[game]
+            row = simulator.simulation_hist.get_step(simulator.cur_step)
+            if row is not None:
+                codes[game] = row
+                continue
+
+            queried[game] = True
+            states[game] = simulator.board.get_state_ref()
+            if self.readonly_state:
+                states[game] = states[game].read_only()
+
+        self.cur_steps[games] += 1
+        for game, cur_step in zip(games.tolist(), self.cur_steps[games].tolist()):
+            self.simulators[game].cur_step = cur_step
+
+        # alive players of the queried games, game by game in player order
+        request_games, request_players = np.nonzero(queried[:, None] & (self.arrays.player_health > 0))
+        if len(request_games):
+            requests = [
+                (self.strategies[game][player], states[game])
+                for game, player in zip(request_games.tolist(), request_players.tolist())
+            ]
+            moves = query_strategies(requests, self.profiler, self.num_query_threads)
+            request_codes = np.fromiter(map(encode_move, moves), dtype=np.uint8, count=len(moves))
+            if (request_codes == NO_MOVE).any():
+                logger.warning(
+                    "Incorrect moves %s", [move for move, code in zip(moves, request_codes) if code == NO_MOVE]
+                )
+            codes[request_games, request_players] = request_codes
+
+        for game in np.flatnonzero(queried).tolist():
+            self.simulators[game].simulation_hist.record(codes[game])
+
+        return codes
+
+    def handle_shoots(self, codes: npt.NDArray[np.uint8]):
+        arrays = self.arrays
+        num_of_games, num_of_players = codes.shape
+        games = np.arange(num_of_games)[:, None]
+        shooting = _code_is_shoot[codes]
+        dx, dy = _code_dx[codes], _code_dy[codes]
+
+        # all rays at once, positions don't change during the shooting phase: a shot hits the nearest player
+        # standing in its line closer than the nearest wall (every player, even a dead one, is on the board)
+        x = arrays.player_x.astype(np.intp)
+        y = arrays.player_y.astype(np.intp)
+        directions = _shoot_direction_index[dx + 1, dy + 1]
+        wall_distance = self.wall_distance[games, np.maximum(directions, 0), y, x]
+        rel_x = x[:, None, :] - x[:, :, None]
+        rel_y = y[:, None, :] - y[:, :, None]
+        ahead = rel_x * dx[:, :, None] + rel_y * dy[:, :, None]
+        in_line = np.where(dx[:, :, None] != 0, rel_y == 0, rel_x == 0) & (ahead > 0)
+        ahead = np.where(in_line, ahead, np.iinfo(np.intp).max)
+        targets = np.where(
+            shooting & (ahead.min(axis=2, initial=np.iinfo(np.intp).max) < wall_distance), ahead.argmin(axis=2), -1
+        )
+
+        # damage and score are applied in player order: a shooter killed earlier in the turn gets no score
+        for shooter in range(num_of_players):
+            hit_games = np.flatnonzero(targets[:, shooter] >= 0)
+            if not len(hit_games):
+                continue
+
+            target = targets[hit_games, shooter]
+            arrays.player_health[hit_games, target] = np.maximum(arrays.player_health[hit_games, target] - 1, 0)
+            arrays.player_score[hit_games[arrays.player_health[hit_games, shooter] > 0], shooter] += 1
+
+    def _add_free_cells(self, games: npt.NDArray, x: npt.NDArray, y: npt.NDArray):
+        """FreeCellIndex.add for one cell in each of the given (distinct) games"""
+        index = self.free_cells
+        inner = (x > 0) & (x < index.size_x - 1) & (y > 0) & (y < index.size_y - 1)
+        games, flat = games[inner], (y * index.size_x + x)[inner]
+        count = index.count[games, 0]
+        index.cells[games, count] = flat
+        index.positions[games, flat] = count
+        index.count[games, 0] += 1
+
+    def _remove_free_cells(self, games: npt.NDArray, x: npt.NDArray, y: npt.NDArray):
+        """FreeCellIndex.remove for one cell in each of the given (distinct) games"""
+        index = self.free_cells
+        flat = y * index.size_x + x
+        positions = index.positions[games, flat]
+        present = positions >= 0
+        games, flat, positions = games[present], flat[present], positions[present]
+        last = index.count[games, 0] - 1
+        moved = index.cells[games, last]
+        index.cells[games, positions] = moved
+        index.positions[games, moved] = positions
+        index.positions[games, flat] = -1
+        index.count[games, 0] = last
+
+    def handle_direct_moves(self, codes: npt.NDArray[np.uint8]):
+        arrays = self.arrays
+        moving_players = _code_is_direct_move[codes]
+        picked = np.zeros(len(self.boards), dtype=np.intp)
+        moved = []
+        for mover in range(codes.shape[1]):
+            game = np.flatnonzero(moving_players[:, mover] & (arrays.player_health[:, mover] > 0))
+            old_x = arrays.player_x[game, mover].astype(np.intp)
+            old_y = arrays.player_y[game, mover].astype(np.intp)
+            new_x = old_x + _code_dx[codes[game, mover]]
+            new_y = old_y + _code_dy[codes[game, mover]]
+            target_kinds = arrays.kinds[game, new_y, new_x]
+            moving = (target_kinds != CellKind.WALL) & (target_kinds != CellKind.PLAYER)
+            if not moving.any():
+                continue
+
+            game, old_x, old_y, new_x, new_y = game[moving], old_x[moving], old_y[moving], new_x[moving], new_y[moving]
+            target_kinds = target_kinds[moving]
+            values = arrays.values[game, new_y, new_x].astype(np.int32)
+
+            arrays.kinds[game, old_y, old_x] = CellKind.EMPTY
+            arrays.player_ids[game, old_y, old_x] = -1
+            self._add_free_cells(game, old_x, old_y)
+
+            health = arrays.player_health[game, mover]
+            is_heal = target_kinds == CellKind.HEAL_BONUS
+            is_poison = target_kinds == CellKind.POISON_BONUS
+            health[is_heal] = np.minimum(health[is_heal] + values[is_heal], self.max_health[game[is_heal]])
+            health[is_poison] = np.maximum(health[is_poison] - values[is_poison], 0)
+            arrays.player_health[game, mover] = health
+            arrays.player_score[game, mover] += np.where(target_kinds == CellKind.SCORE_BONUS, values, 0)
+            # a player moves once per step, so the games of a mover are distinct
+            picked[game[target_kinds != CellKind.EMPTY]] += 1
+
+            self._remove_free_cells(game, new_x, new_y)
+            arrays.kinds[game, new_y, new_x] = CellKind.PLAYER
+            arrays.values[game, new_y, new_x] = 0
+            arrays.player_ids[game, new_y, new_x] = mover
+            arrays.player_x[game, mover] = new_x
+            arrays.player_y[game, mover] = new_y
+            moved.extend(
+                zip(
+                    game.tolist(), old_x.tolist(), old_y.tolist(), new_x.tolist(), new_y.tolist(), target_kinds.tolist()
+                )
+            )
+
+        # the per-board line-of-sight lines and item index are Python structures, kept for strategies
+        for game, old_x, old_y, new_x, new_y, target_kind in moved:
+            board = self.boards[game]
+            board.line_of_sight.remove_player(old_x, old_y)
+            board.line_of_sight.add_player(new_x, new_y)
+            if target_kind in kind2bonus:
+                board.objects.remove_item(target_kind, new_x, new_y)
+
+        self.available_items -= picked
+
+    def finish_step(self, games: npt.NDArray[np.intp]):
+        """Respawns the items of the games which made a step.
+
+        Cells and items are drawn with the generator of each board, so the sequence matches Simulator.finish_step,
+        only the games which lack items are visited.
+        """
+        spawns = []
+        lacking = games[self.available_items[games] < self.num_of_items[games]]
+        for game, count in zip(lacking.tolist(), (self.num_of_items - self.available_items)[lacking].tolist()):
+            board = self.boards[game]
+            drawn = board.draw_items(count)
+            for x, y, kind, value in drawn:
+                board.objects.add_item(kind, x, y)
+                spawns.append((game, y, x, kind, value))
+            self.available_items[game] += len(drawn)
+
+        if spawns:
+            game, y, x, kinds, values = np.array(spawns, dtype=np.intp).T
+            self.arrays.kinds[game, y, x] = kinds
+            self.arrays.values[game, y, x] = values
+            self.arrays.player_ids[game, y, x] = -1
+
+        for board, available_items in zip(self.boards, self.available_items.tolist()):
+            board.available_items = available_items
+
+    def step(self) -> npt.NDArray[np.uint8]:
+        """Returns the move codes of the step, see generate_moves"""
+        if self.profiler is not None:
+            return self._profiled_step()
+
+        games = np.flatnonzero(self.active)
+        codes = self.generate_moves()
+        self.handle_shoots(codes)
+        self.handle_direct_moves(codes)
+        self.finish_step(games)
+        return codes
+
+    def _profiled_step(self) -> npt.NDArray[np.uint8]:
+        games = np.flatnonzero(self.active)
+        with self.profiler.phase("generate_moves"):
+            codes = self.generate_moves()
+        with self.profiler.phase("handle_shoots"):
+            self.handle_shoots(codes)
+        with self.profiler.phase("handle_direct_moves"):
+            self.handle_direct_moves(codes)
+        with self.profiler.phase("finish_step"):
+            self.finish_step(games)
+        return codes
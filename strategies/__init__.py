@@ -1,7 +1,6 @@
-from . import (
-    aartur,
-    core,
-    neural_network,
-)
-
 from .registration import strategies_registrant
+
+# strategy packages are imported only when one of their strategies is asked for
+strategies_registrant.register_lazy("RandomStrategy", "strategies.core")
+strategies_registrant.register_lazy("AArturSmartStrategy", "strategies.aartur")
+strategies_registrant.register_lazy("NeuralStrategy", "strategies.neural_network")
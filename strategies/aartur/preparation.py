@@ -1,27 +1,42 @@
-from collections import deque
-from typing import Deque
+import array
+import numpy as np
 
-from rules import State, Wall, Player
+from rules import CellKind, Player, State
 
 
 class ExtendedState:
     """More convenient State, containing current player and other players."""
 
     def __init__(self, state: State, player_name: str):
+        self._state = state
         self.cells = state.cells
+        self.line_of_sight = state.line_of_sight
+        self.objects = state.objects
+        self.walls = state.walls
         self.size_y = len(self.cells)
         self.size_x = len(self.cells[0])
 
+        # players in the order of the rows of the board
+        if self.objects is not None:
+            players = self.objects.players()
+            positions = sorted((player.y, player.x, name) for name, player in players.items())
+            cells = [players[name] for _, _, name in positions]
+        else:
+            arrays = self.arrays
+            positions = sorted(zip(arrays.player_y.tolist(), arrays.player_x.tolist(), arrays.player_names))
+            cells = [self.get_cell(x=x, y=y) for y, x, _ in positions]
         self.player: Player
         self.other_players: list[Player] = []
-        for y in range(self.size_y):
-            for x in range(self.size_x):
-                cell = self.get_cell(x=x, y=y)
-                if isinstance(cell, Player):
-                    if cell.name == player_name:
-                        self.player = cell
-                    else:
-                        self.other_players.append(cell)
+        for (_, _, name), cell in zip(positions, cells):
+            if name == player_name:
+                self.player = cell
+            else:
+                self.other_players.append(cell)
+
+    @property
+    def arrays(self):
+        """Arrays of the state, an object board is packed only when something reads them"""
+        return self._state.arrays
 
     def get_cell(self, *, x: int, y: int):
         return self.cells[y][x]
@@ -48,40 +63,108 @@ class ReachabilityGraphCell:
 
 
 class ReachabilityGraph:
-    """Calculates distance and path from state.player to all other cells.
+    """Calculates distance and path from state.player (or from several sources at once) to all other cells.
 
-    ReachabilityGraph is being constructed once per each turn and then is being used in algorithms
-    that require some kind of movement on the board.
+    ReachabilityGraph is being filled once per each turn and then is being used in algorithms
+    that require some kind of movement on the board. BFS state lives in flat integer buffers
+    (index = (y + 1) * (size_x + 2) + x + 1, the board is padded with a blocked border),
+    which are allocated once and reused by every fill while the board size doesn't change.
     """
 
-    def __init__(self, state: ExtendedState):
-        """Constructing a ReachabilityGraph from State"""
-        self.size_x = state.size_x
-        self.size_y = state.size_y
-        self.graph: list[list[ReachabilityGraphCell]] = [
-            [ReachabilityGraphCell() for _ in range(state.size_x)] for _ in range(state.size_y)
-        ]
-
-        self._fill_graph(state, state.player.x, state.player.y)
-
-    def _fill_graph(self, state: ExtendedState, start_x: int, start_y: int):
-        # Iterative function for filling graph cells (BFS)
-        self.set_cell(ReachabilityGraphCell(dist=0, visited=True), x=start_x, y=start_y)
-
-        cells: Deque[tuple[int, int, int]] = deque()
-        cells.append((start_x, start_y, 1))
-        while cells:
-            x, y, dist = cells.popleft()
-
-            for dx in (-1, 0, 1):
-                for dy in (-1, 0, 1):
-                    new_x, new_y = x + dx, y + dy
-                    if (
-                        not isinstance(state.get_cell(x=new_x, y=new_y), (Player, Wall))
-                        and not self.get_cell(x=new_x, y=new_y).visited
-                    ):
-                        cells.append((new_x, new_y, dist + 1))
-                        self.set_cell(ReachabilityGraphCell(dist=dist, dx=dx, dy=dy, visited=True), x=new_x, y=new_y)
+    # dx-major order of the original BFS, it decides which parent wins a tie
+    DIRECTIONS = tuple((dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy)
+    UNREACHABLE = -1
+    BLOCKED = -2
+
+    def __init__(self, state: ExtendedState | None = None):
+        """Constructing a ReachabilityGraph from State, or an empty one to be filled later"""
+        self.size_x = 0
+        self.size_y = 0
+        self._stride = 0
+        self._offsets: list[tuple[int, int]] = []
+        self._dist = array.array("i")
+        self._direction = array.array("b")
+        self._source = array.array("i")
+        self._queue: list[int] = []
+        self.dist = np.empty((0, 0), dtype=np.int32)
+
+        if state is not None:
+            self.fill(state, [(state.player.x, state.player.y)])
+
+    def _resize(self, size_x: int, size_y: int):
+        if (size_x, size_y) == (self.size_x, self.size_y):
+            return
+
+        self.size_x, self.size_y = size_x, size_y
+        self._stride = size_x + 2
+        self._offsets = [(dy * self._stride + dx, direction) for direction, (dx, dy) in enumerate(self.DIRECTIONS)]
+        size = (size_y + 2) * self._stride
+        self._dist = array.array("i", bytes(4 * size))
+        self._direction = array.array("b", bytes(size))
+        self._source = array.array("i", bytes(4 * size))
+        # zero-copy view of the distances without the padding, negative for unreachable cells
+        self.dist = np.frombuffer(self._dist, dtype=np.int32).reshape(size_y + 2, self._stride)[1:-1, 1:-1]
+
+    def _index(self, x: int, y: int) -> int:
+        return (y + 1) * self._stride + x + 1
+
+    def fill(self, state: ExtendedState, sources: list[tuple[int, int]]):
+        """BFS from all sources at once, a cell gets the distance to the nearest of them.
+
+        Walls and players block moves, the source cells themselves are at distance 0.
+        """
+        if state.objects is not None and state.walls is not None:
+            self._resize(state.walls.shape[1], state.walls.shape[0])
+            blocked = np.pad(state.walls, 1, constant_values=True)
+            for x, y in state.objects.player_coords().values():
+                blocked[y + 1, x + 1] = True
+        else:
+            kinds = state.arrays.kinds
+            self._resize(kinds.shape[1], kinds.shape[0])
+            blocked = np.pad((kinds == CellKind.WALL) | (kinds == CellKind.PLAYER), 1, constant_values=True)
+        # blocked cells are marked in dist itself, so the BFS checks a single value per neighbour
+        np.frombuffer(self._dist, dtype=np.int32)[...] = np.where(blocked, self.BLOCKED, self.UNREACHABLE).ravel()
+
+        dist, direction, source, queue, offsets = self._dist, self._direction, self._source, self._queue, self._offsets
+        unreachable = self.UNREACHABLE
+        queue.clear()
+        for source_index, (x, y) in enumerate(sources):
+            index = self._index(x, y)
+            if dist[index] < 0:
+                dist[index] = 0
+                direction[index] = -1
+                source[index] = source_index
+                queue.append(index)
+
+        # the loop also visits indexes appended while it runs, the list is the FIFO queue
+        for index in queue:
+            new_dist = dist[index] + 1
+            index_source = source[index]
+            for offset, offset_direction in offsets:
+                new_index = index + offset
+                if dist[new_index] == unreachable:
+                    dist[new_index] = new_dist
+                    direction[new_index] = offset_direction
+                    source[new_index] = index_source
+                    queue.append(new_index)
+
+    def is_reachable(self, x: int, y: int) -> bool:
+        return self._dist[self._index(x, y)] >= 0
+
+    def get_dist(self, x: int, y: int) -> int:
+        """Number of moves to the cell, UNREACHABLE (or BLOCKED for walls and players) if there is no way"""
+        return self._dist[self._index(x, y)]
+
+    def get_source(self, x: int, y: int) -> int:
+        """Index of the nearest source (in the order given to fill) of a reachable cell"""
+        return self._source[self._index(x, y)]
+
+    def get_step(self, x: int, y: int) -> tuple[int, int]:
+        """Direction of the last move on the way to a reachable cell, (0, 0) for sources"""
+        index = self._index(x, y)
+        if self._dist[index] <= 0:
+            return 0, 0
+        return self.DIRECTIONS[self._direction[index]]
 
     def show(self) -> str:
         str_size: int = 12
@@ -96,16 +179,18 @@ class ReachabilityGraph:
 
     def get_direction_to(self, x: int, y: int) -> tuple[int, int]:
         """Calculates direction from the original cell to a given cell."""
-        cell = self.get_cell(x=x, y=y)
-        while cell.dist > 1:
-            x -= cell.dx
-            y -= cell.dy
-            cell = self.get_cell(x=x, y=y)
+        dx, dy = self.get_step(x, y)
+        while self.get_dist(x, y) > 1:
+            x -= dx
+            y -= dy
+            dx, dy = self.get_step(x, y)
 
-        return cell.dx, cell.dy
+        return dx, dy
 
     def get_cell(self, *, x: int, y: int) -> ReachabilityGraphCell:
-        return self.graph[y][x]
+        """The cell as an object, slow, prefer get_dist and is_reachable"""
+        if not self.is_reachable(x, y):
+            return ReachabilityGraphCell()
 
-    def set_cell(self, cell: ReachabilityGraphCell, *, x: int, y: int):
-        self.graph[y][x] = cell
+        dx, dy = self.get_step(x, y)
+        return ReachabilityGraphCell(dist=self.get_dist(x, y), dx=dx, dy=dy, visited=True)
@@ -1,5 +1,7 @@
+import numpy as np
+
 from strategies.core import BaseMove, DirectMove, Shoot
-from rules import Wall, ScoreBonus, HealBonus, Player
+from rules import ScoreBonus, HealBonus, Player
 
 from .preparation import ExtendedState, ReachabilityGraph
 
@@ -31,21 +33,31 @@ class CollectBonusSolver(BaseSolver):
         """
         raise NotImplementedError()
 
-    def solve(self, state: ExtendedState, graph: ReachabilityGraph) -> tuple[BaseMove, float]:
-        bonuses: list[tuple[int, int]] = []  # list of coordinates of all bonuses on the map
-        for y in range(state.size_y):
-            for x in range(state.size_x):
-                if isinstance(state.get_cell(x=x, y=y), self.bonus_type) and graph.get_cell(x=x, y=y).visited:
-                    bonuses.append((x, y))
+    @staticmethod
+    def find_bonuses(state: ExtendedState, kind) -> tuple[np.ndarray, np.ndarray]:
+        """x and y of all bonuses of the kind, from the index of the board when the state has it"""
+        if state.objects is not None:
+            coords = state.objects.items[kind].coords()
+            return coords[:, 0], coords[:, 1]
 
-        if not bonuses:
+        y, x = np.nonzero(state.arrays.kinds == kind)
+        return x, y
+
+    def solve(self, state: ExtendedState, graph: ReachabilityGraph) -> tuple[BaseMove, float]:
+        # distances to all reachable bonuses on the map
+        xs, ys = self.find_bonuses(state, self.bonus_type.kind)
+        bonus_dist = graph.dist[ys, xs]
+        reachable = bonus_dist >= 0
+        if not reachable.any():
             return DirectMove(dx=0, dy=0), 0.0
 
-        # choosing the closest bonus as our goal (for now ignoring the bonus value)
-        x, y = min(bonuses, key=lambda elem: graph.get_cell(x=elem[0], y=elem[1]).dist)
+        # choosing the closest bonus as our goal (for now ignoring the bonus value), the first one in a tie
+        xs, ys, bonus_dist = xs[reachable], ys[reachable], bonus_dist[reachable]
+        closest = np.lexsort((xs, ys, bonus_dist))[0]
+        x, y = int(xs[closest]), int(ys[closest])
         dx, dy = graph.get_direction_to(x, y)
 
-        dist = graph.get_cell(x=x, y=y).dist
+        dist = graph.get_dist(x, y)
         confidence = self.calculate_confidence(dist, state.player)
 
         return DirectMove(dx=dx, dy=dy), confidence
@@ -93,25 +105,22 @@ class ShootSolver(BaseSolver):
                 continue
             shoot_positions: list[tuple[int, int]] = []
             for dx, dy in (-1, 0), (1, 0), (0, -1), (0, 1):
-                x = enemy.x + dx
-                y = enemy.y + dy
-
-                # finding all possible positions from which we can shoot at enemy
-                while not isinstance(state.get_cell(x=x, y=y), (Wall,)):
-                    if isinstance(state.get_cell(x=x, y=y), Player) and (x != state.player.x or y != state.player.y):
-                        # all *other* players are blocking our shot, so breaking
-                        # (we don't count *ourselves* as an obstacle for shooting!)
-                        break
-                    if graph.get_cell(x=x, y=y).visited:
+                # finding all possible positions from which we can shoot at enemy:
+                # everything up to the first wall or *other* player on the line
+                # (we don't count *ourselves* as an obstacle for shooting!)
+                end_x, end_y = state.line_of_sight.cast(enemy.x, enemy.y, dx, dy)
+                if end_x == state.player.x and end_y == state.player.y:
+                    end_x, end_y = state.line_of_sight.cast(end_x, end_y, dx, dy)
+
+                for step in range(1, abs(end_x - enemy.x) + abs(end_y - enemy.y)):
+                    x = enemy.x + dx * step
+                    y = enemy.y + dy * step
+                    if graph.is_reachable(x, y):
                         shoot_positions.append((x, y))
-                    x += dx
-                    y += dy
 
             if shoot_positions:
                 # finding the closest shooting position
-                closest_shoot_position = min(
-                    shoot_positions, key=lambda elem: graph.get_cell(x=elem[0], y=elem[1]).dist
-                )
+                closest_shoot_position = min(shoot_positions, key=lambda elem: graph.get_dist(*elem))
                 closest_shoot_positions.append((enemy, closest_shoot_position))
 
         if not closest_shoot_positions:
@@ -120,7 +129,7 @@ class ShootSolver(BaseSolver):
         # constructing and assessing move for each enemy
         shoot_moves: list[tuple[BaseMove, float]] = []
         for enemy, (x, y) in closest_shoot_positions:
-            if graph.get_cell(x=x, y=y).dist > 0:
+            if graph.get_dist(x, y) > 0:
                 # if distance > 0 then we cannot shoot directly, we have to walk
                 move = graph.get_direction_to(x, y)
                 move = DirectMove(dx=move[0], dy=move[1])
@@ -20,10 +20,13 @@ class AArturBaseStrategy(BaseStrategy):
     """
 
     solvers: dict[BaseSolver, float] = attr.ib(factory=dict, init=False)
+    # buffers of the graph are reused from turn to turn
+    _graph: ReachabilityGraph = attr.ib(factory=ReachabilityGraph, init=False, eq=False, repr=False)
 
     def get_next_move(self, state: State) -> BaseMove:
         state = ExtendedState(state, self.player_name)
-        graph = ReachabilityGraph(state)
+        graph = self._graph
+        graph.fill(state, [(state.player.x, state.player.y)])
 
         best_move = DirectMove(dx=0, dy=0)
         best_score = 0.0
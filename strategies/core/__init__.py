@@ -11,6 +11,9 @@ __all__ = (
     "BaseStrategy",
     "RandomStrategy",
     "ExceptionStrategy",
+    "NO_MOVE",
+    "encode_move",
+    "decode_move",
 )
 
 
@@ -58,6 +61,38 @@ class BaseStrategy:
     def get_next_move(self, state: State) -> BaseMove:
         raise NotImplementedError()
 
+    @classmethod
+    def get_next_moves(cls, strategies: list["BaseStrategy"], states: list[State]) -> list[BaseMove]:
+        """Batch-decision protocol: moves of several players using strategies of this class, maybe from different
+        games. Simulator asks every class once per turn. By default every strategy decides on its own,
+        classes which can decide for a batch faster override it.
+        """
+        return [strategy.get_next_move(state) for strategy, state in zip(strategies, states)]
+
+    @classmethod
+    def split_batch(cls, strategies: list["BaseStrategy"], num_tasks: int) -> list[list[int]]:
+        """Groups of indexes of strategies which are queried concurrently, each with its own get_next_moves call.
+
+        Classes without their own get_next_moves decide a strategy at a time, so every strategy is a task,
+        the others get the whole batch as one. Override it to split a batch into up to num_tasks parts.
+        """
+        if cls.get_next_moves.__func__ is BaseStrategy.get_next_moves.__func__:
+            return [[index] for index in range(len(strategies))]
+        return [list(range(len(strategies)))]
+
+
+NO_MOVE = 255
+_move2code = {(type(move), move.dx, move.dy): code for code, move in enumerate(BaseStrategy._possible_moves)}
+
+
+def encode_move(move: BaseMove) -> int:
+    """Index of the move in BaseStrategy._possible_moves, fits a byte. NO_MOVE for anything else"""
+    return _move2code.get((type(move), getattr(move, "dx", None), getattr(move, "dy", None)), NO_MOVE)
+
+
+def decode_move(code: int) -> BaseMove | None:
+    return BaseStrategy._possible_moves[code] if code != NO_MOVE else None
+
 
 @register_strategy
 @attr.s(slots=True, kw_only=True)
@@ -1,5 +1,5 @@
 from strategies.registration import register_strategy
-from .perceptron import NeuralStrategy
+from .perceptron import NeuralPopulation, NeuralStrategy
 
 
 register_strategy(NeuralStrategy)
@@ -1,12 +1,14 @@
 import attr
+import collections
 import copy
 import numpy as np
 import numpy.typing as npt
+import threading
 import typing
 
-from genetic import Individual
+from genetic import Individual, Population
 from rules import *  # noqa
-from rules import BaseObject
+from rules import BaseObject, BoardArrays, CellKind, PlayerName
 from strategies.core import BaseMove, BaseStrategy
 import util as lib_util
 
@@ -33,6 +35,19 @@ def act_tanh(x: npt.ArrayLike) -> npt.ArrayLike:
     return 2 * act_sigmoid(2 * x) - 1
 
 
+MUTATION_PROB = 0.1
+MUTATION_SCALE = 1e-3
+CROSSOVER_ETA = 10
+
+
+def _sbx_beta(shape: tuple[int, ...]) -> np.ndarray:
+    """Spread factors of simulated binary crossover"""
+    rand = np.random.random(shape)
+    beta = np.where(rand < 0.5, 2 * rand, 1.0 / (2 * (1 - rand)))
+    beta **= 1.0 / (CROSSOVER_ETA + 1)
+    return beta
+
+
 @attr.s(slots=True, kw_only=True)
 class Perceptron:
     input_size: int = attr.ib()
@@ -59,10 +74,137 @@ class Perceptron:
     def __call__(self, x):
         return self.forward(x)
 
+    @property
+    def layout(self) -> tuple:
+        """Perceptrons of the same layout can be stacked, see PerceptronStack"""
+        return tuple(weight.shape for weight in self.weights), self.activation
+
+
+# kept stacks copy the weights of their perceptrons, the oldest ones are dropped above this many perceptrons in all
+MAX_STACKED_PERCEPTRONS = 256
+# smaller batches are stacked into one forward pass rather than split between threads
+MIN_CHUNK_SIZE = 8
+
+
+@attr.s(slots=True, kw_only=True)
+class PerceptronStack:
+    """Weights of perceptrons of the same layout stacked per layer: layers[k][i] is the k-th weight of the i-th
+    perceptron, so a forward pass of all of them is one matmul per layer.
+
+    Stacks of the recently seen groups are kept, so the weights are copied once per game rather than every turn.
+    Weights are changed in place only by mutate, which drops the kept stacks with forget.
+    """
+
+    perceptrons: tuple[Perceptron, ...] = attr.ib()
+    layers: list[np.ndarray] = attr.ib()
+    activation: Activation = attr.ib()
+
+    # by ids of the perceptrons, a kept stack holds them, so the ids can't be reused by other perceptrons
+    _cached: typing.ClassVar[dict[tuple[int, ...], "PerceptronStack"]] = {}
+    _lock: typing.ClassVar[threading.Lock] = threading.Lock()
+
+    @classmethod
+    def get(cls, perceptrons: typing.Sequence[Perceptron]) -> "PerceptronStack":
+        key = tuple(map(id, perceptrons))
+        with cls._lock:
+            stack = cls._cached.pop(key, None)
+            if stack is None:
+                stack = cls(
+                    perceptrons=tuple(perceptrons),
+                    layers=[np.stack(layer) for layer in zip(*(perceptron.weights for perceptron in perceptrons))],
+                    activation=perceptrons[0].activation,
+                )
+            # the most recently used one goes last and is always kept
+            cls._cached[key] = stack
+            num_of_perceptrons = sum(len(cached.perceptrons) for cached in cls._cached.values())
+            while num_of_perceptrons > MAX_STACKED_PERCEPTRONS and len(cls._cached) > 1:
+                num_of_perceptrons -= len(cls._cached.pop(next(iter(cls._cached))).perceptrons)
+        return stack
+
+    @classmethod
+    def forget(cls):
+        with cls._lock:
+            cls._cached.clear()
+
+    def forward(self, x: npt.ArrayLike) -> npt.ArrayLike:
+        """Row i of x goes through the i-th perceptron"""
+        x = np.asarray(x)[:, None, :]
+        for layer in self.layers:
+            x = self.activation(np.matmul(x, layer))
+        return x[:, 0]
+
+
+CELL_FEATURES = 8
+
+# one-hot part of the cell embedding indexed by CellKind: Wall, HealBonus, PoisonBonus, ScoreBonus, Player
+_kind_one_hot = np.eye(len(CellKind), 5, k=-1, dtype=np.float16)
+
+
+@attr.s(slots=True, kw_only=True)
+class StateEncoder:
+    """Writes the embeddings of NeuralStrategy.encode_cell for a whole board straight from BoardArrays.
+
+    The embeddings of the previous call are kept in a preallocated array and only the cells whose kind or value
+    changed since then are rewritten, plus the cells of players, whose health and score change in place.
+    """
+
+    player_name: PlayerName = attr.ib()
+    features: npt.NDArray[np.float16] = attr.ib(default=None, init=False)
+    _kinds: npt.NDArray[np.int8] = attr.ib(default=None, init=False)
+    _values: npt.NDArray[np.int8] = attr.ib(default=None, init=False)
+
+    def _reset(self, shape: tuple[int, int]):
+        self.features = np.zeros((*shape, CELL_FEATURES), dtype=np.float16)
+        self._kinds = np.full(shape, -1, dtype=np.int8)
+        self._values = np.zeros(shape, dtype=np.int8)
+
+    def encode(self, arrays: BoardArrays) -> npt.NDArray[np.float16]:
+        if self.features is None or self._kinds.shape != arrays.kinds.shape:
+            self._reset(arrays.kinds.shape)
+
+        ys, xs = np.nonzero((arrays.kinds != self._kinds) | (arrays.values != self._values))
+        kinds = arrays.kinds[ys, xs]
+        values = arrays.values[ys, xs]
+        self.features[ys, xs, :5] = _kind_one_hot[kinds]
+        self.features[ys, xs, 5] = values
+        self.features[ys, xs, 6:] = 0
+        self._kinds[ys, xs] = kinds
+        self._values[ys, xs] = values
+
+        # in a window some players may be outside of it
+        size_y, size_x = arrays.kinds.shape
+        player_x, player_y = arrays.player_x, arrays.player_y
+        visible = (player_x >= 0) & (player_x < size_x) & (player_y >= 0) & (player_y < size_y)
+        player_x, player_y = player_x[visible], player_y[visible]
+        self.features[player_y, player_x, 5] = arrays.player_health[visible]
+        self.features[player_y, player_x, 6] = arrays.player_score[visible]
+        self.features[player_y, player_x, 7] = 0
+        if self.player_name in arrays.player_names:
+            index = arrays.player_index(self.player_name)
+            if visible[index]:
+                self.features[arrays.player_y[index], arrays.player_x[index], 7] = 1
+
+        return self.features.reshape(-1)
+
 
 @attr.s(slots=True, kw_only=True)
 class NeuralStrategy(BaseStrategy, Individual):
-    perceptron: Perceptron = attr.ib(factory=lambda: Perceptron(input_size=800, output_size=13))
+    perceptron: Perceptron = attr.ib(default=None)
+    _encoder: typing.Optional[StateEncoder] = attr.ib(default=None, init=False, eq=False, repr=False)
+    # the network sees a square of side 2 * view_radius + 1 centered at the player instead of the whole board,
+    # so its size doesn't depend on the map size
+    view_radius: typing.Optional[int] = attr.ib(default=None)
+
+    def __attrs_post_init__(self):
+        if self.perceptron is None:
+            self.perceptron = Perceptron(input_size=self.input_size, output_size=len(self._possible_moves))
+
+    @property
+    def input_size(self) -> int:
+        if getattr(self, "view_radius", None) is None:
+            return 800  # whole 10x10 board
+
+        return (2 * self.view_radius + 1) ** 2 * CELL_FEATURES
 
     def encode_cell(self, cell: BaseObject | None) -> list[float]:
         match cell:  # noqa
@@ -82,11 +224,15 @@ class NeuralStrategy(BaseStrategy, Individual):
                 raise TypeError("Unknown cell type")
 
     def encode_state(self, state: State) -> npt.ArrayLike:
-        embeddings = []
-        for row in state.cells:
-            for cell in row:
-                embeddings.extend(self.encode_cell(cell))
-        return np.array(embeddings, dtype=np.float16)
+        """encode_cell of every cell, row by row. The result is a buffer reused by the next call"""
+        # strategies unpickled from before the encoder and the window existed have these slots unset
+        if getattr(self, "view_radius", None) is not None:
+            state = state.window(self.player_name, self.view_radius)
+
+        encoder = getattr(self, "_encoder", None)
+        if encoder is None or encoder.player_name != self.player_name:
+            encoder = self._encoder = StateEncoder(player_name=self.player_name)
+        return encoder.encode(state.arrays)
 
     def decode_move(self, out: npt.ArrayLike) -> BaseMove:
         idx = np.argmax(out)
@@ -98,23 +244,118 @@ class NeuralStrategy(BaseStrategy, Individual):
         move = self.decode_move(out)
         return move
 
+    @staticmethod
+    def _group_by_layout(strategies: list["NeuralStrategy"]) -> list[list[int]]:
+        layout2indexes = collections.defaultdict(list)
+        for index, strategy in enumerate(strategies):
+            layout2indexes[strategy.perceptron.layout].append(index)
+        return list(layout2indexes.values())
+
+    @classmethod
+    def get_next_moves(cls, strategies: list["NeuralStrategy"], states: list[State]) -> list[BaseMove]:
+        # players whose perceptrons have the same layout go through one batched forward pass, see PerceptronStack
+        moves = [None] * len(strategies)
+        for indexes in cls._group_by_layout(strategies):
+            x = np.stack([strategies[i].encode_state(states[i]) for i in indexes])
+            perceptrons = [strategies[i].perceptron for i in indexes]
+            if all(perceptron is perceptrons[0] for perceptron in perceptrons):
+                out = perceptrons[0](x)
+            else:
+                out = PerceptronStack.get(perceptrons).forward(x)
+            for index, row in zip(indexes, out):
+                moves[index] = strategies[index].decode_move(row)
+
+        return moves
+
+    @classmethod
+    def split_batch(cls, strategies: list["NeuralStrategy"], num_tasks: int) -> list[list[int]]:
+        """A task per perceptron layout, split into up to num_tasks chunks of at least MIN_CHUNK_SIZE players.
+        Stacked matmuls release the GIL, so the chunks run in parallel
+        """
+        tasks = []
+        for indexes in cls._group_by_layout(strategies):
+            num_chunks = max(min(num_tasks, len(indexes) // MIN_CHUNK_SIZE), 1)
+            tasks.extend(chunk.tolist() for chunk in np.array_split(indexes, num_chunks))
+        return tasks
+
     def mutate(self):
         """Gaussian mutation with standard parameter values mu=0 and sigma=1"""
-        prob = 0.1
         for layer in self.perceptron.weights:
-            mask = np.random.random(layer.shape) < prob
-            noise = np.random.normal(size=layer.shape, scale=1e-3)
+            mask = np.random.random(layer.shape) < MUTATION_PROB
+            noise = np.random.normal(size=layer.shape, scale=MUTATION_SCALE)
             layer[mask] += noise[mask]
+        PerceptronStack.forget()
 
     def crossover(self, other: "NeuralStrategy") -> "NeuralStrategy":
-        eta = 10
         child = copy.deepcopy(self)
         for i, (layer, other_layer) in enumerate(zip(self.perceptron.weights, other.perceptron.weights)):
-            rand = np.random.random(layer.shape)
-            beta = np.where(rand < 0.5, 2 * rand, 1.0 / (2 * (1 - rand)))
-            beta **= 1.0 / (eta + 1)
+            beta = _sbx_beta(layer.shape)
             if lib_util.roll_dice(0.5):
                 layer, other_layer = other_layer, layer
             child.perceptron.weights[i] = ((1 + beta) * layer + (1 - beta) * other_layer) / 2
 
         return child
+
+
+@attr.s(slots=True, kw_only=True)
+class NeuralPopulation(Population):
+    """Weights of NeuralStrategy individuals stacked per layer: layers[k][i] is the k-th weight of the i-th individual"""
+
+    layers: list[np.ndarray] = attr.ib()
+    strategy_kwargs: dict = attr.ib(factory=dict)
+    _individuals: typing.Optional[list[NeuralStrategy]] = attr.ib(default=None, init=False, repr=False)
+
+    @classmethod
+    def init(cls, size: int, **strategy_kwargs) -> "NeuralPopulation":
+        weights = [NeuralStrategy(**strategy_kwargs).perceptron.weights for _ in range(size)]
+        return cls(layers=[np.stack(layer) for layer in zip(*weights)], strategy_kwargs=strategy_kwargs)
+
+    def __len__(self) -> int:
+        return len(self.layers[0])
+
+    def individuals(self) -> list[NeuralStrategy]:
+        # perceptron weights are views of the rows, so pickling an individual doesn't drag the whole population along
+        if self._individuals is None:
+            self._individuals = [
+                NeuralStrategy(
+                    perceptron=Perceptron(
+                        input_size=self.layers[0].shape[1],
+                        output_size=self.layers[-1].shape[2],
+                        hidden_layer_sizes=tuple(layer.shape[2] for layer in self.layers[:-1]),
+                        weights=[layer[row] for layer in self.layers],
+                    ),
+                    **self.strategy_kwargs,
+                )
+                for row in range(len(self))
+            ]
+        return self._individuals
+
+    def _evolve(self, layers: list[np.ndarray]) -> "NeuralPopulation":
+        return NeuralPopulation(layers=layers, strategy_kwargs=self.strategy_kwargs)
+
+    def take(self, indexes: npt.ArrayLike) -> "NeuralPopulation":
+        return self._evolve([layer[indexes] for layer in self.layers])
+
+    def crossover(self, first: npt.ArrayLike, second: npt.ArrayLike) -> "NeuralPopulation":
+        """Same SBX as NeuralStrategy.crossover, for all pairs at once"""
+        first, second = np.asarray(first), np.asarray(second)
+        children = []
+        for layer in self.layers:
+            beta = _sbx_beta((len(first), *layer.shape[1:]))
+            # like roll_dice there, which parent the child is closer to is decided per layer
+            swap = np.random.random(len(first)) < 0.5
+            parent, other = np.where(swap, second, first), np.where(swap, first, second)
+            children.append(((1 + beta) * layer[parent] + (1 - beta) * layer[other]) / 2)
+        return self._evolve(children)
+
+    def mutate(self, indexes: npt.ArrayLike):
+        """Same Gaussian mutation as NeuralStrategy.mutate, for all given rows at once"""
+        indexes = np.asarray(indexes)
+        for layer in self.layers:
+            shape = (len(indexes), *layer.shape[1:])
+            mask = np.random.random(shape) < MUTATION_PROB
+            layer[indexes] += np.where(mask, np.random.normal(size=shape, scale=MUTATION_SCALE), 0)
+        PerceptronStack.forget()
+
+    def concat(self, other: "NeuralPopulation") -> "NeuralPopulation":
+        return self._evolve([np.concatenate(pair) for pair in zip(self.layers, other.layers)])
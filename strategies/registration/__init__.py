@@ -1,17 +1,32 @@
+import importlib
+
+
 class Registrant:
     def __init__(self):
         self._participants = {}
+        # names of participants which aren't imported yet and modules which register them
+        self._modules = {}
 
     def register(self, participant: type):
         assert participant.__name__ not in self._participants
         self._participants[participant.__name__] = participant
 
+    def register_lazy(self, name: str, module: str):
+        """The participant is registered by `module`, which is imported on the first get_participant"""
+        self._modules[name] = module
+
     def get_participant(self, name):
+        if name not in self._participants and name in self._modules:
+            importlib.import_module(self._modules[name])
+
         if name not in self._participants:
             raise ValueError(f"Participant {name} is not registered")
 
         return self._participants[name]
 
+    def names(self) -> list[str]:
+        return sorted(self._participants.keys() | self._modules.keys())
+
 
 strategies_registrant = Registrant()
 
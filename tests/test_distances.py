@@ -0,0 +1,49 @@
+import collections
+
+import numpy as np
+
+from distances import DIRECTIONS, DistanceField
+from rules import LevelMap
+
+
+def bfs(wall_mask: np.ndarray, x: int, y: int) -> dict[tuple[int, int], int]:
+    """Distances from (x, y) to every reachable cell"""
+    dist = {(x, y): 0}
+    queue = collections.deque([(x, y)])
+    while queue:
+        x, y = queue.popleft()
+        for dx, dy in DIRECTIONS:
+            cell = x + dx, y + dy
+            if 0 <= cell[0] < wall_mask.shape[1] and 0 <= cell[1] < wall_mask.shape[0]:
+                if not wall_mask[cell[1], cell[0]] and cell not in dist:
+                    dist[cell] = dist[x, y] + 1
+                    queue.append(cell)
+    return dist
+
+
+def test_distance_field_matches_bfs(tmp_path):
+    wall_mask = np.asarray(LevelMap.load("level_maps/level10x10.txt").walls)
+    field = DistanceField.get(tmp_path, wall_mask)
+    size_y, size_x = wall_mask.shape
+
+    for y in range(size_y):
+        for x in range(size_x):
+            if wall_mask[y, x]:
+                continue
+            dist = bfs(wall_mask, x, y)
+            for target_y in range(size_y):
+                for target_x in range(size_x):
+                    expected = dist.get((target_x, target_y), -1)
+                    assert field.get_dist(x, y, target_x, target_y) == expected
+                    step = field.get_step(x, y, target_x, target_y)
+                    if expected > 0:
+                        assert field.get_dist(x + step[0], y + step[1], target_x, target_y) == expected - 1
+                    else:
+                        assert step is None
+
+
+def test_large_layout_is_reported_once(tmp_path, caplog):
+    wall_mask = np.zeros((60, 60), dtype=np.bool_)
+    for _ in range(3):
+        assert DistanceField.get(tmp_path, wall_mask) is None
+    assert len(caplog.records) == 1
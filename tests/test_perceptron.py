@@ -0,0 +1,68 @@
+import numpy as np
+
+from rules import Board
+from simulation import query_strategies
+from strategies.neural_network.perceptron import NeuralStrategy, PerceptronStack
+
+
+def make_game():
+    np.random.seed(0)
+    board = Board(size_x=10, size_y=10, num_of_items=10, max_health=10, player_names=list("abcd"), seed=0)
+    strategies = [NeuralStrategy(player_name=player_name) for player_name in board.player_names]
+    return board.get_state_ref(), strategies
+
+
+def count_forward_passes(monkeypatch) -> list[int]:
+    """Batch sizes of PerceptronStack.forward calls"""
+    batch_sizes = []
+    forward = PerceptronStack.forward
+
+    def counted_forward(self, x):
+        batch_sizes.append(len(x))
+        return forward(self, x)
+
+    monkeypatch.setattr(PerceptronStack, "forward", counted_forward)
+    return batch_sizes
+
+
+def test_distinct_perceptrons_single_forward_pass(monkeypatch):
+    state, strategies = make_game()
+    expected = [strategy.get_next_move(state) for strategy in strategies]
+    batch_sizes = count_forward_passes(monkeypatch)
+
+    moves = NeuralStrategy.get_next_moves(strategies, [state] * len(strategies))
+
+    assert batch_sizes == [len(strategies)]
+    assert moves == expected
+
+
+def test_mutated_weights_are_restacked():
+    state, strategies = make_game()
+    perceptrons = [strategy.perceptron for strategy in strategies]
+    NeuralStrategy.get_next_moves(strategies, [state] * len(strategies))
+
+    strategies[0].perceptron.weights[0][...] = 0
+    strategies[0].mutate()
+
+    stack = PerceptronStack.get(perceptrons)
+    for layer, weight in zip(stack.layers, strategies[0].perceptron.weights):
+        assert np.array_equal(layer[0], weight)
+
+
+def test_split_batch_chunks_large_batches():
+    np.random.seed(0)
+    small = [NeuralStrategy(player_name="a") for _ in range(4)]
+    large = [NeuralStrategy(player_name="a") for _ in range(32)]
+
+    assert NeuralStrategy.split_batch(small, 4) == [[0, 1, 2, 3]]
+    chunks = NeuralStrategy.split_batch(large, 4)
+    assert len(chunks) == 4
+    assert sorted(index for chunk in chunks for index in chunk) == list(range(32))
+
+
+def test_threaded_query_gives_the_same_moves():
+    state, strategies = make_game()
+    strategies *= 4
+    requests = [(strategy, state) for strategy in strategies]
+
+    assert query_strategies(requests, num_threads=4) == query_strategies(requests)
@@ -0,0 +1,90 @@
+import random
+
+import numpy as np
+import pytest
+
+from rules import SHOOT_DIRECTIONS, Board, ReadOnlyStateError
+from simulation import Simulator
+from strategies.core import RandomStrategy
+
+
+@pytest.mark.parametrize("storage", ["objects", "arrays"])
+def test_read_only_state_fields_cant_be_assigned(storage):
+    board = Board(size_x=10, size_y=10, num_of_items=10, max_health=10, player_names=list("ab"), storage=storage)
+    state = board.get_state_ref().read_only()
+
+    for name in ("cells", "objects", "line_of_sight", "distances"):
+        with pytest.raises(ReadOnlyStateError):
+            setattr(state, name, None)
+    assert not state.arrays.kinds.flags.writeable
+    with pytest.raises(ReadOnlyStateError):
+        state.window("a", 2).cells = None
+
+
+def walk(board: Board, x: int, y: int, dx: int, dy: int) -> tuple[int, int]:
+    """The cell a shot from (x, y) hits, found by stepping over the board"""
+    x, y = x + dx, y + dy
+    while board.can_move_to(x, y):
+        x, y = x + dx, y + dy
+    return x, y
+
+
+def play(board: Board, num_of_steps: int):
+    """Yields after every step of a game of random strategies"""
+    simulator = Simulator(
+        board=board,
+        strategies=[RandomStrategy(player_name=player_name) for player_name in board.player_names],
+        num_of_steps=num_of_steps,
+        readonly_state=False,
+    )
+    while not simulator.is_endgame:
+        simulator.step()
+        yield simulator
+
+
+@pytest.mark.parametrize("storage", ["objects", "arrays"])
+def test_free_cell_index_matches_scan(storage):
+    random.seed(0)
+    board = Board(
+        size_x=12, size_y=9, num_of_items=30, max_health=10, player_names=list("abcd"), storage=storage, seed=3
+    )
+    for _ in play(board, 100):
+        empty = {(x, y) for y in range(board.size_y) for x in range(board.size_x) if board.is_empty(x, y)}
+        indexed = {divmod(int(flat), board.size_x)[::-1] for flat in board.free_cells.cells[: len(board.free_cells)]}
+        assert indexed == empty
+
+
+@pytest.mark.parametrize("storage", ["objects", "arrays"])
+def test_line_of_sight_matches_scan(storage):
+    random.seed(0)
+    board = Board(
+        size_x=20,
+        size_y=15,
+        num_of_items=40,
+        max_health=10,
+        player_names=list("abcdefgh"),
+        storage=storage,
+        seed=1,
+        level_map_path="level_maps/level.txt",
+    )
+    for simulator in play(board, 60):
+        for player in simulator.players:
+            for dx, dy in SHOOT_DIRECTIONS:
+                assert board.line_of_sight.cast(player.x, player.y, dx, dy) == walk(board, player.x, player.y, dx, dy)
+
+
+def test_read_only_views_leave_the_board_writeable():
+    board = Board(size_x=10, size_y=10, num_of_items=10, max_health=10, player_names=list("ab"), storage="arrays")
+    state = board.get_state_ref().read_only()
+
+    assert not state.arrays.kinds.flags.writeable and board.arrays.kinds.flags.writeable
+    assert not state.line_of_sight.wall_distance.flags.writeable
+    assert board.free_cells.cells.flags.writeable
+
+
+def test_item_coords_of_no_kinds():
+    board = Board(size_x=10, size_y=10, num_of_items=10, max_health=10, player_names=list("ab"))
+
+    coords = board.objects.item_coords(kinds=[])
+    assert coords.shape == (0, 2) and coords.dtype == np.intp
+    assert board.objects.nearest_items(1, 1, kinds=[]) == []
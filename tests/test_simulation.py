@@ -0,0 +1,139 @@
+import copy
+import random
+
+import numpy as np
+import pytest
+
+from rules import Board
+from simulation import SimulationHistory, Simulator, VectorizedSimulator
+from strategies.aartur import AArturSmartStrategy
+from strategies.core import RandomStrategy
+
+ARRAY_FIELDS = ("kinds", "values", "player_ids", "player_x", "player_y", "player_health", "player_score")
+BOARD_CONFIG = dict(
+    size_x=10,
+    size_y=10,
+    num_of_items=20,
+    max_health=10,
+    level_map_path="level_maps/level10x10.txt",
+    player_names=list("abcd"),
+    seed=7,
+)
+
+
+def make_boards(num_of_games: int) -> list[Board]:
+    return [
+        Board(
+            size_x=10,
+            size_y=10,
+            num_of_items=20,
+            max_health=3,
+            player_names=list("abcd"),
+            storage="arrays",
+            seed=seed,
+            level_map_path="level_maps/level10x10.txt",
+        )
+        for seed in range(num_of_games)
+    ]
+
+
+def make_strategies(board: Board) -> list[AArturSmartStrategy]:
+    return [AArturSmartStrategy(player_name=player_name) for player_name in board.player_names]
+
+
+def test_vectorized_simulator_matches_simulator():
+    boards = make_boards(8)
+    expected_boards = copy.deepcopy(boards)
+    simulator = VectorizedSimulator(
+        boards=boards,
+        strategies=[make_strategies(board) for board in boards],
+        simulation_hists=[SimulationHistory(mode="none") for _ in boards],
+        num_of_steps=40,
+        readonly_state=True,
+    )
+    while not simulator.is_endgame:
+        simulator.step()
+
+    for board, expected, game in zip(boards, expected_boards, simulator.simulators):
+        reference = Simulator(
+            board=expected,
+            strategies=make_strategies(expected),
+            simulation_hist=SimulationHistory(mode="none"),
+            num_of_steps=40,
+            readonly_state=True,
+        )
+        while not reference.is_endgame:
+            reference.step()
+
+        assert game.cur_step == reference.cur_step
+        assert board.available_items == expected.available_items
+        for field in ARRAY_FIELDS:
+            assert np.array_equal(getattr(board.arrays, field), getattr(expected.arrays, field)), field
+        assert board.line_of_sight.rows == expected.line_of_sight.rows
+        assert sorted(board.free_cells.cells[: len(board.free_cells)]) == sorted(
+            expected.free_cells.cells[: len(expected.free_cells)]
+        )
+
+
+def dump(board: Board) -> list[list[str]]:
+    return [
+        [repr(board.get_cell(x, y)).replace("PlayerView", "Player") for x in range(board.size_x)]
+        for y in range(board.size_y)
+    ]
+
+
+def play(board_config: dict, simulation_hist: SimulationHistory, **kwargs) -> Simulator:
+    board = Board(**board_config)
+    simulator = Simulator(
+        board=board,
+        strategies=[RandomStrategy(player_name=player_name) for player_name in board.player_names],
+        simulation_hist=simulation_hist,
+        num_of_steps=100,
+        readonly_state=False,
+        **kwargs,
+    )
+    while not simulator.is_endgame:
+        simulator.step()
+    return simulator
+
+
+@pytest.mark.parametrize("storage", ["objects", "arrays"])
+def test_replay_of_stream_matches_live_game(tmp_path, storage):
+    board_config = {**BOARD_CONFIG, "storage": storage}
+    random.seed(1)
+    simulation_hist = SimulationHistory(board_config=board_config, stream_path=str(tmp_path / "game.hist"), capacity=16)
+    live = play(board_config, simulation_hist)
+    simulation_hist.close()
+
+    # the moves come from the history, not from the differently seeded random strategies
+    random.seed(2)
+    replay = play(board_config, SimulationHistory.read_stream(str(tmp_path / "game.hist")))
+
+    assert replay.cur_step == live.cur_step
+    assert dump(replay.board) == dump(live.board)
+
+
+@pytest.mark.parametrize("storage", ["objects", "arrays"])
+def test_seek_matches_replay(storage):
+    board_config = {**BOARD_CONFIG, "storage": storage}
+    random.seed(1)
+    simulation_hist = SimulationHistory(board_config=board_config)
+    board = Board(**board_config)
+    simulator = Simulator(
+        board=board,
+        strategies=[RandomStrategy(player_name=player_name) for player_name in board.player_names],
+        simulation_hist=simulation_hist,
+        num_of_steps=100,
+        readonly_state=False,
+        snapshot_every=20,
+    )
+    boards = [dump(simulator.board)]
+    while not simulator.is_endgame:
+        simulator.step()
+        boards.append(dump(simulator.board))
+
+    random.seed(2)
+    for step in (5, 60, 0, len(boards) - 1, 37, 36, 40, 41):
+        simulator.seek(step)
+        assert simulator.cur_step == step
+        assert dump(simulator.board) == boards[step], step